@@ -0,0 +1,82 @@
+# vim: set expandtab:
+"""Cost of the wire logging call sites of the client while DEBUG logging
+is off.
+
+    python benchmarks/bench_debug_logging.py
+
+Reads run on a BaseClient wired to the loopback, with debug_wire off and
+on. The calls of LazyFormat.__str__ and pprint.pformat are counted over
+the requests first, none is expected with DEBUG off. Then the requests
+are timed, the difference between debug_wire on and off is what the
+guarded call sites of _write_pdu, _request and _dispatch cost.
+"""
+import asyncio
+import logging
+import pprint
+import time
+
+import loopback
+from pundun import utils
+from pundun.client import BaseClient
+
+REQUESTS = 5000
+
+class Formats:
+    """Counts the calls of LazyFormat.__str__ and pprint.pformat."""
+
+    def __init__(self):
+        self.lazy = 0
+        self.pformat = 0
+
+    def __enter__(self):
+        (self.str, self.fmt) = (utils.LazyFormat.__str__, pprint.pformat)
+        def lazy_str(obj):
+            self.lazy += 1
+            return self.str(obj)
+        def pformat(*args, **kwargs):
+            self.pformat += 1
+            return self.fmt(*args, **kwargs)
+        utils.LazyFormat.__str__ = lazy_str
+        pprint.pformat = pformat
+        return self
+
+    def __exit__(self, *exc):
+        utils.LazyFormat.__str__ = self.str
+        pprint.pformat = self.fmt
+
+def reads(client, requests):
+    key = {'id': 'key'}
+    coros = [client._read('bench', key) for i in range(requests)]
+    return client.loop.run_until_complete(asyncio.gather(*coros))
+
+def run(debug_wire, requests):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = loopback.make_client(BaseClient, loop, debug_wire = debug_wire)
+    reads(client, 100)
+    with Formats() as formats:
+        reads(client, requests)
+    elapsed = []
+    for i in range(5):
+        start = time.perf_counter()
+        reads(client, requests)
+        elapsed.append(time.perf_counter() - start)
+    client.timer.cancel()
+    loop.close()
+    return (formats.lazy, formats.pformat,
+            min(elapsed) / requests * 1e9)
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    print('{:<16} {:>10} {:>10} {:>12}'.format(
+        'debug_wire', 'LazyFormat', 'pformat', 'ns/request'))
+    results = {}
+    for debug_wire in (False, True):
+        results[debug_wire] = run(debug_wire, REQUESTS)
+        print('{:<16} {:>10} {:>10} {:>12.0f}'.format(
+            str(debug_wire), *results[debug_wire]))
+    print('{:<16} {:>34.0f}'.format(
+        'on - off', results[True][2] - results[False][2]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# vim: set expandtab:
+"""Formatting a 10k row read_range response with the HasField decoders
+that utils had before and with the current WhichOneof decoders.
+
+    python benchmarks/bench_decode.py
+
+The response is parsed once; the times are those of formatting it.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pundun import apollo_pb2 as apollo
+from pundun import utils
+
+ROWS = 10000
+
+def legacy_format_rpdu(pdu):
+    if pdu.HasField('response'):
+        return legacy_format_response(pdu.response)
+    elif pdu.HasField('error'):
+        return utils.format_error(pdu.error)
+
+def legacy_format_response(response):
+    if response.HasField('ok'):
+        return True
+    elif response.HasField('columns'):
+        return legacy_format_fields(response.columns.fields)
+    elif response.HasField('key_columns_pair'):
+        return legacy_format_kcp(response.key_columns_pair)
+    elif response.HasField('key_columns_list'):
+        return legacy_format_kcl(response.key_columns_list)
+
+def legacy_format_fields(fields):
+    return dict([legacy_format_field(f) for f in fields])
+
+def legacy_format_field(field):
+    return (field.name, legacy_format_value(field.value))
+
+def legacy_format_value(val):
+    value = None
+    if val.HasField('boolean'):
+        value = val.boolean
+    elif val.HasField('int'):
+        value = val.int
+    elif val.HasField('binary'):
+        value = val.binary
+    elif val.HasField('null'):
+        value = None
+    elif val.HasField('double'):
+        value = val.double
+    elif val.HasField('string'):
+        value = val.string
+    elif val.HasField('list'):
+        value = [legacy_format_value(v) for v in val.list.values]
+    elif val.HasField('map'):
+        value = {k: legacy_format_value(v)
+                 for k, v in val.map.values.items()}
+    return value
+
+def legacy_format_kcp(kcp):
+    return (legacy_format_fields(kcp.key), legacy_format_fields(kcp.columns))
+
+def legacy_format_kcl(key_columns_list):
+    kcl = [legacy_format_kcp(kcp) for kcp in key_columns_list.list]
+    cont = key_columns_list.continuation
+    if cont.complete:
+        cont = 'complete'
+    else:
+        cont = legacy_format_fields(cont.key)
+    return {'key_columns_list': kcl, 'continuation': cont}
+
+def make_response():
+    pdu = apollo.ApolloPdu()
+    pdu.transaction_id = 1
+    kcl = pdu.response.key_columns_list
+    for i in range(ROWS):
+        key = {'id': i, 'ts': 1500000000 + i}
+        columns = {'name': 'row ' + str(i), 'count': i, 'score': i / 7,
+                   'flag': i % 2 == 0, 'data': b'\x00' * 32,
+                   'tags': ['a', 'b'], 'attrs': {'x': 1}}
+        kcl.list.add().CopyFrom(utils.make_key_columns_pair(key, columns))
+    kcl.continuation.complete = True
+    rpdu = apollo.ApolloPdu()
+    rpdu.ParseFromString(pdu.SerializeToString())
+    return rpdu
+
+def best(fn):
+    return min(timeit.repeat(fn, number=1, repeat=5)) * 1e3
+
+def main():
+    rpdu = make_response()
+    assert legacy_format_rpdu(rpdu) == utils.format_rpdu(rpdu)
+    old = best(lambda: legacy_format_rpdu(rpdu))
+    new = best(lambda: utils.format_rpdu(rpdu))
+    print('{:>6} {:>12} {:>12} {:>8}'.format(
+        'rows', 'HasField ms', 'WhichOneof ms', 'speedup'))
+    print('{:>6} {:>12.1f} {:>12.1f} {:>7.2f}x'.format(
+        ROWS, old, new, old / new))
+
+if __name__ == '__main__':
+    main()
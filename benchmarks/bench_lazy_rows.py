@@ -0,0 +1,57 @@
+# vim: set expandtab:
+"""Formatting a read_range response into dicts and into lazy FieldsView
+rows of which two columns are read.
+
+    python benchmarks/bench_lazy_rows.py
+
+The response holds 10k rows of 40 columns of mixed types, including
+lists and maps, and is parsed once.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pundun import apollo_pb2 as apollo
+from pundun import utils
+
+ROWS = 10000
+COLUMNS = 40
+SAMPLES = [123456, 'column value', 3.25, b'\x00' * 16, ['a', 'b', 1],
+           {'x': 1, 'y': 'z'}]
+
+def make_response():
+    pdu = apollo.ApolloPdu()
+    kcl = pdu.response.key_columns_list
+    columns = dict(('c%d' % i, SAMPLES[i % len(SAMPLES)])
+                   for i in range(COLUMNS))
+    for i in range(ROWS):
+        kcp = utils.make_key_columns_pair({'id': i}, columns)
+        kcl.list.add().CopyFrom(kcp)
+    kcl.continuation.complete = True
+    rpdu = apollo.ApolloPdu()
+    rpdu.ParseFromString(pdu.SerializeToString())
+    return rpdu
+
+def read_two(rpdu, lazy):
+    res = utils.format_rpdu(rpdu, lazy)
+    return [(columns['c1'], columns['c4'])
+            for (_, columns) in res['key_columns_list']]
+
+def best(fn):
+    return min(timeit.repeat(fn, number=1, repeat=3)) * 1e3
+
+def main():
+    rpdu = make_response()
+    assert read_two(rpdu, False) == read_two(rpdu, True)
+    assert utils.format_rpdu(rpdu) == utils.format_rpdu(rpdu, True)
+    eager = best(lambda: read_two(rpdu, False))
+    lazy = best(lambda: read_two(rpdu, True))
+    print('{:>6} {:>8} {:>10} {:>10} {:>8}'.format(
+        'rows', 'columns', 'dict ms', 'view ms', 'speedup'))
+    print('{:>6} {:>8} {:>10.1f} {:>10.1f} {:>7.2f}x'.format(
+        ROWS, COLUMNS, eager, lazy, eager / lazy))
+
+if __name__ == '__main__':
+    main()
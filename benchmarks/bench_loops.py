@@ -0,0 +1,68 @@
+# vim: set expandtab:
+"""Request throughput of a Client on the asyncio and the uvloop event loop.
+
+Needs a pundun server, like the tests:
+
+    python benchmarks/bench_loops.py [host [port [requests]]]
+
+Runs a mix of writes, reads, range reads and batch writes with many
+requests in flight, once per loop implementation. The uvloop row is
+skipped if uvloop is not installed.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pundun import Client
+
+TABLE = 'pundunpy_bench_loops'
+
+def request_mix(client, requests):
+    coros = []
+    for i in range(requests):
+        key = {'id': i % 1000}
+        kind = i % 10
+        if kind < 3:
+            coros.append(client._write(TABLE, key, {'count': i}))
+        elif kind < 8:
+            coros.append(client._read(TABLE, key))
+        elif kind < 9:
+            coros.append(client._read_range_n(TABLE, key, 10))
+        else:
+            writes = [({'id': j}, {'count': i}) for j in range(10)]
+            coros.append(client._batch_write(TABLE, writes, []))
+    return coros
+
+def run(host, port, requests, loop_factory):
+    client = Client(host, port, 'admin', 'admin', loop_factory=loop_factory)
+    if TABLE not in client.list_tables():
+        client.create_table(TABLE, ['id'], {'num_of_shards': 8})
+    coros = request_mix(client, 1000)
+    client.loop.run_until_complete(asyncio.gather(*coros))
+    start = time.perf_counter()
+    coros = request_mix(client, requests)
+    client.loop.run_until_complete(asyncio.gather(*coros))
+    elapsed = time.perf_counter() - start
+    client.cleanup()
+    return requests / elapsed
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8887
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    loops = [('asyncio', asyncio.new_event_loop)]
+    try:
+        import uvloop
+        loops.append(('uvloop', uvloop.new_event_loop))
+    except ImportError:
+        print('uvloop is not installed, only asyncio is measured')
+    print('{:<10} {:>12}'.format('loop', 'requests/s'))
+    for (name, loop_factory) in loops:
+        rate = run(host, port, requests, loop_factory)
+        print('{:<10} {:>12.0f}'.format(name, rate))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# vim: set expandtab:
+"""Write and read throughput of ParallelExecutor by number of processes.
+
+Needs a pundun server, like the tests:
+
+    python benchmarks/bench_parallel.py [host [port [rows]]]
+
+Each row is written and read once per process count. The client side
+scales with the processes until the server or the network is saturated.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pundun import Client
+from pundun.parallel import ParallelExecutor
+
+TABLE = 'pundunpy_bench_parallel'
+
+def columns(i):
+    return {'name': 'row ' + str(i), 'count': i, 'text': 'x' * 200}
+
+def rate(executor, procedure, calls):
+    start = time.perf_counter()
+    results = executor.map(procedure, calls)
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for r in results if isinstance(r, (tuple, Exception)))
+    return (len(calls) / elapsed, errors)
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8887
+    rows = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    client = Client(host, port, 'admin', 'admin')
+    if TABLE not in client.list_tables():
+        client.create_table(TABLE, ['id'], {'num_of_shards': 8})
+    client.cleanup()
+    writes = [(TABLE, {'id': i}, columns(i)) for i in range(rows)]
+    reads = [(TABLE, {'id': i}) for i in range(rows)]
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    print('{:>9} {:>12} {:>12} {:>7}'.format(
+        'processes', 'writes/s', 'reads/s', 'errors'))
+    for processes in counts:
+        with ParallelExecutor(host, port, 'admin', 'admin',
+                              processes = processes) as executor:
+            (write_rate, write_errors) = rate(executor, 'write', writes)
+            (read_rate, read_errors) = rate(executor, 'read', reads)
+        print('{:>9} {:>12.0f} {:>12.0f} {:>7}'.format(
+            processes, write_rate, read_rate, write_errors + read_errors))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# vim: set expandtab:
+"""Encoding a read pdu as Client.read does and with a prepared read.
+
+    python benchmarks/bench_prepared.py
+
+Both produce the bytes of the same read request, on a key of one and of
+three fields.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pundun import apollo_pb2 as apollo
+from pundun import utils
+from pundun.prepared import PreparedRead
+
+TABLE = 'pundunpy_bench_prepared'
+KEYS = [{'id': 123456},
+        {'id': 123456, 'name': 'some name', 'ts': 1500000000}]
+
+def with_pdu(tid, key):
+    pdu = apollo.ApolloPdu()
+    pdu.version.major = 0
+    pdu.version.minor = 1
+    pdu.transaction_id = tid
+    pdu.read.table_name = TABLE
+    pdu.read.key.extend(utils.make_fields(key))
+    return pdu.SerializeToString()
+
+def best(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+def main():
+    prepared = PreparedRead(None, TABLE)
+    print('{:>10} {:>10} {:>12} {:>8}'.format(
+        'key fields', 'pdu us', 'prepared us', 'speedup'))
+    for key in KEYS:
+        assert with_pdu(1000, key) == prepared.encode(1000, key)
+        old = best(lambda: with_pdu(1000, key), 20000)
+        new = best(lambda: prepared.encode(1000, key), 20000)
+        print('{:>10} {:>10.2f} {:>12.2f} {:>7.2f}x'.format(
+            len(key), old, new, old / new))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# vim: set expandtab:
+"""Cost of turning a received read_range response into a result, with the
+raw option off, set to 'pdu' and set to 'bytes'.
+
+    python benchmarks/bench_raw.py
+
+The response holds 1000 rows of 10 columns. Parsing and formatting are
+measured as the client runs them for every response frame.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pundun import apollo_pb2 as apollo
+from pundun import utils
+from pundun.client import BaseClient
+
+ROWS = 1000
+
+def make_payload():
+    pdu = apollo.ApolloPdu()
+    pdu.version.minor = 1
+    pdu.transaction_id = 1
+    kcl = pdu.response.key_columns_list
+    columns = dict(('c%d' % i, 'value %d' % i) for i in range(10))
+    for i in range(ROWS):
+        kcl.list.add().CopyFrom(
+                utils.make_key_columns_pair({'id': i}, columns))
+    kcl.continuation.complete = True
+    return pdu.SerializeToString()
+
+def result(client, payload):
+    (_, rpdu) = client._parse(memoryview(payload))
+    return client._format(rpdu)
+
+def best(fn):
+    return min(timeit.repeat(fn, number=3, repeat=3)) / 3 * 1e3
+
+def main():
+    payload = make_payload()
+    print('{:>6} {:>10}'.format('raw', 'ms'))
+    for raw in (None, 'pdu', 'bytes'):
+        client = BaseClient('127.0.0.1', 8887, 'admin', 'admin', raw = raw)
+        elapsed = best(lambda: result(client, payload))
+        print('{:>6} {:>10.3f}'.format(str(raw), elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# vim: set expandtab:
+"""Encoding a row with utils.make_fields and with a compiled TableSchema.
+
+    python benchmarks/bench_schema.py
+
+Both encode the columns of a write pdu, for rows of 10 and 100 columns of
+mixed int, str, float and bytes values.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pundun import apollo_pb2 as apollo
+from pundun import utils
+from pundun.schema import TableSchema
+
+TYPES = [int, str, float, bytes]
+SAMPLES = {int: 123456, str: 'column value', float: 3.25, bytes: b'\x00' * 16}
+
+def make_row(columns):
+    types = dict(('c%d' % i, TYPES[i % len(TYPES)]) for i in range(columns))
+    row = dict((name, SAMPLES[t]) for (name, t) in types.items())
+    return (types, row)
+
+def with_make_fields(row):
+    pdu = apollo.ApolloPdu()
+    pdu.write.columns.extend(utils.make_fields(row))
+    return pdu
+
+def with_schema(schema, row):
+    pdu = apollo.ApolloPdu()
+    schema.columns.encode(pdu.write.columns, row)
+    return pdu
+
+def best(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+def main():
+    print('{:>8} {:>14} {:>14} {:>8}'.format(
+        'columns', 'make_fields us', 'schema us', 'speedup'))
+    for columns in (10, 100):
+        (types, row) = make_row(columns)
+        schema = TableSchema('bench', {'id': int}, types)
+        assert (with_make_fields(row).SerializeToString() ==
+                with_schema(schema, row).SerializeToString())
+        number = 20000 // columns
+        old = best(lambda: with_make_fields(row), number)
+        new = best(lambda: with_schema(schema, row), number)
+        print('{:>8} {:>14.1f} {:>14.1f} {:>7.2f}x'.format(
+            columns, old, new, old / new))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# vim: set expandtab:
+"""Scheduler objects, memory and time per request in _write_pdu.
+
+Compares the former response path, an asyncio.Queue plus a Task plus
+wait_for per request, with the future table and the shared timer wheel.
+
+    python benchmarks/bench_write_pdu.py
+"""
+import asyncio
+import logging
+import pprint
+import time
+import tracemalloc
+
+import loopback
+from pundun import apollo_pb2 as apollo
+from pundun.client import BaseClient
+
+class LegacyClient(BaseClient):
+    """The response path before the future table, kept for comparison."""
+
+    def _dispatch(self, frame):
+        cid = int.from_bytes(frame[:2], byteorder='big')
+        q = self.message_dict.get(cid, False)
+        if q:
+            q.put_nowait(frame[2:].tobytes())
+            logging.debug('put q: %s', pprint.pformat(q))
+
+    def _get_cid(self):
+        cid = getattr(self, 'cid', 0)
+        self.cid = 0 if cid == 65535 else cid + 1
+        return cid
+
+    async def _write_pdu(self, pdu, timeout = None):
+        pdu.transaction_id = self._get_tid()
+        logging.debug('pdu: %s', pprint.pformat(pdu))
+        data = pdu.SerializeToString()
+        logging.debug('encoded pdu: %s', pprint.pformat(data))
+        cid = self._get_cid()
+        cid_bytes = cid.to_bytes(2, byteorder='big')
+        logging.debug('cid_bytes: %s', pprint.pformat(cid_bytes))
+        q = asyncio.Queue(maxsize = 1)
+        self.message_dict[cid] = q
+        self.write_data(b''.join([cid_bytes, data]))
+        coro = self.loop.create_task(q.get())
+        rpdu = apollo.ApolloPdu()
+        try:
+            rdata = await asyncio.wait_for(coro, timeout=60)
+            logging.debug('received data: %s', pprint.pformat(rdata))
+            rpdu.ParseFromString(rdata)
+        except asyncio.TimeoutError:
+            rpdu.error.transport = 'timeout'
+        del self.message_dict[cid]
+        return rpdu
+
+class Counter:
+    """Counts tasks and timer handles created on a loop."""
+
+    def __init__(self, loop):
+        self.tasks = 0
+        self.timers = 0
+        call_at = loop.call_at
+        def counting_call_at(*args, **kwargs):
+            self.timers += 1
+            return call_at(*args, **kwargs)
+        loop.call_at = counting_call_at
+        def task_factory(loop, coro, **kwargs):
+            self.tasks += 1
+            return asyncio.Task(coro, loop=loop, **kwargs)
+        loop.set_task_factory(task_factory)
+
+def run(cls, requests):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = loopback.make_client(cls, loop)
+    key = {'id': 'key'}
+    loop.run_until_complete(client._read('bench', key))
+
+    start = time.perf_counter()
+    coros = [client._read('bench', key) for i in range(requests)]
+    loop.run_until_complete(asyncio.gather(*coros))
+    elapsed = time.perf_counter() - start
+
+    counter = Counter(loop)
+    tracemalloc.start()
+    coros = [client._read('bench', key) for i in range(requests)]
+    base = tracemalloc.get_traced_memory()[0]
+    loop.run_until_complete(asyncio.gather(*coros))
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    client.timer.cancel()
+    loop.close()
+    # gather wraps every coroutine in a task of its own.
+    return (elapsed / requests * 1e6,
+            (counter.tasks - requests) / requests,
+            counter.timers / requests,
+            peak / requests)
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    print('{:<14} {:>10} {:>10} {:>11} {:>16}'.format(
+        'path', 'us/req', 'tasks/req', 'timers/req', 'peak B/inflight'))
+    for (name, cls) in [('queue+task', LegacyClient),
+                        ('future table', BaseClient)]:
+        res = run(cls, 5000)
+        print('{:<14} {:>10.1f} {:>10.2f} {:>11.2f} {:>16.0f}'.format(
+            name, *res))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# vim: set expandtab:
+"""In-memory stand-in for a pundun server used by the benchmarks.
+
+The loopback transport answers every request frame by feeding the response
+frame to the client's protocol on the next loop iteration, so benchmarks
+measure the client side only: encoding, bookkeeping, dispatch and decoding.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pundun import apollo_pb2 as apollo
+from pundun.client import BaseClient
+from pundun.protocol import PundunProtocol
+from pundun.timer import TimerWheel
+
+def ok_response(pdu):
+    rpdu = apollo.ApolloPdu()
+    rpdu.response.ok = 'ok'
+    return rpdu
+
+class LoopbackTransport:
+    def __init__(self, loop, protocol, respond):
+        self.loop = loop
+        self.protocol = protocol
+        self.respond = respond
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def set_write_buffer_limits(self, high = None, low = None):
+        pass
+
+    def write(self, data):
+        view = memoryview(data)
+        out = []
+        while view:
+            length = int.from_bytes(view[:4], 'big')
+            frame = view[4:4 + length]
+            view = view[4 + length:]
+            pdu = apollo.ApolloPdu()
+            pdu.ParseFromString(frame[2:])
+            rpdu = self.respond(pdu)
+            rpdu.version.CopyFrom(pdu.version)
+            rpdu.transaction_id = pdu.transaction_id
+            payload = rpdu.SerializeToString()
+            out.append((len(payload) + 2).to_bytes(4, 'big'))
+            out.append(frame[:2].tobytes())
+            out.append(payload)
+        self.loop.call_soon(self.protocol.data_received, b''.join(out))
+
+    def writelines(self, parts):
+        self.write(b''.join(parts))
+
+    def close(self):
+        pass
+
+def make_client(cls, loop, respond = ok_response, **options):
+    """Create an instance of a BaseClient subclass wired to a loopback."""
+    client = cls.__new__(cls)
+    BaseClient.__init__(client, 'loopback', 0, '', '', loop = loop, **options)
+    client.protocol = PundunProtocol(client._dispatch,
+                                     client._connection_lost)
+    client.transport = LoopbackTransport(loop, client.protocol, respond)
+    client.protocol.connection_made(client.transport)
+    client.timer = TimerWheel(loop, resolution=0.01, slots=1024)
+    return client
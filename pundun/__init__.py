@@ -1,3 +1,5 @@
 from .client import Client
+from .async_client import AsyncClient
+from .pool import ClientPool
 from .utils import *
 from . import apollo_pb2 as apollo
@@ -0,0 +1,109 @@
+# vim: set expandtab:
+import asyncio
+import logging
+
+from pundun.client import BaseClient
+
+class AsyncClient(BaseClient):
+    """Client whose procedures are coroutines on the caller's event loop.
+
+    client = AsyncClient(host, port, user, password)
+    await client.connect()
+    await client.read(table_name, key)
+    await client.close()
+
+    The client can also be used as an asynchronous context manager.
+    """
+
+    def __init__(self, host, port, user, password, **options):
+        logging.info('AsyncClient setup..')
+        super().__init__(host, port, user, password, **options)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self):
+        self.loop = asyncio.get_event_loop()
+        await self._open()
+        return self
+
+    async def close(self):
+        self._disconnect()
+
+    async def create_table(self, table_name, key_def, options, timeout = None):
+        return await self._create_table(table_name, key_def, options, timeout)
+
+    async def delete_table(self, table_name, timeout = None):
+        return await self._delete_table(table_name, timeout)
+
+    async def open_table(self, table_name, timeout = None):
+        return await self._open_table(table_name, timeout)
+
+    async def close_table(self, table_name, timeout = None):
+        return await self._close_table(table_name, timeout)
+
+    async def table_info(self, table_name, attributes = [], timeout = None):
+        return await self._table_info(table_name, attributes, timeout)
+
+    async def write(self, table_name, key, columns, timeout = None):
+        return await self._write(table_name, key, columns, timeout)
+
+    async def delete(self, table_name, key, timeout = None):
+        return await self._delete(table_name, key, timeout)
+
+    async def batch_write(self, table_name, writes, deletes = [],
+                          timeout = None):
+        return await self._batch_write(table_name, writes, deletes, timeout)
+
+    async def update(self, table_name, key, update_operations, timeout = None):
+        return await self._update(table_name, key, update_operations, timeout)
+
+    async def read(self, table_name, key, timeout = None):
+        return await self._read(table_name, key, timeout)
+
+    async def index_read(self, table_name, column_name, term, filter,
+                         timeout = None):
+        return await self._index_read(table_name, column_name, term, filter,
+                                      timeout)
+
+    async def read_range(self, table_name, start_key, end_key, limit,
+                         timeout = None):
+        return await self._read_range(table_name, start_key, end_key, limit,
+                                      timeout)
+
+    async def read_range_n(self, table_name, start_key, n, timeout = None):
+        return await self._read_range_n(table_name, start_key, n, timeout)
+
+    async def read_range_n_ts(self, table_name, start_key, n, timeout = None):
+        return await self._read_range_n_ts(table_name, start_key, n, timeout)
+
+    async def first(self, table_name, timeout = None):
+        return await self._first(table_name, timeout)
+
+    async def last(self, table_name, timeout = None):
+        return await self._last(table_name, timeout)
+
+    async def seek(self, table_name, key, timeout = None):
+        return await self._seek(table_name, key, timeout)
+
+    async def next(self, it, timeout = None):
+        return await self._next(it, timeout)
+
+    async def prev(self, it, timeout = None):
+        return await self._prev(it, timeout)
+
+    async def add_index(self, table_name, config, timeout = None):
+        return await self._add_index(table_name, config, timeout)
+
+    async def remove_index(self, table_name, columns, timeout = None):
+        return await self._remove_index(table_name, columns, timeout)
+
+    async def list_tables(self, timeout = None):
+        return await self._list_tables(timeout)
+
+    def _call_prepared(self, operation, args, timeout = None):
+        return self._execute(operation, args, timeout)
@@ -1,282 +1,606 @@
 # vim: set expandtab:
 import asyncio
-import pprint
+import collections
 import logging
-import sys
-import ssl
-from concurrent.futures import CancelledError
+import struct
+import threading
 
 from pundun import apollo_pb2 as apollo
+from pundun import tls
 from pundun import utils
+from pundun.pipeline import Pipeline
+from pundun.prepared import PreparedRead, PreparedWrite
+from pundun.protocol import PundunProtocol, ZERO_COPY_PARSE
+from pundun.schema import TableSchema
+from pundun.stats import Stats
+from pundun.timer import TimerWheel
+from pundun.tracing import clock
 from scrampy import scram
 
-class Client:
-    """Client class including pundun procedures."""
-
-    def __init__(self, host, port, user, password):
-        logging.info('Client setup..')
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Procedures that may be sent again after a reconnect.
+IDEMPOTENT_PROCEDURES = frozenset(['read', 'read_range', 'read_range_n',
+                                   'read_range_n_ts', 'index_read', 'first',
+                                   'last', 'seek', 'table_info',
+                                   'list_tables'])
+
+# Field number of error in an ApolloPdu.
+ERROR_FIELD = apollo.ApolloPdu.DESCRIPTOR.fields_by_name['error'].number
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (value, pos)
+        shift += 7
+
+def _peek_pdu(data):
+    """Return the transaction id and procedure field number of an encoded
+    ApolloPdu, skipping over the procedure without parsing it.
+    """
+    tid = 0
+    number = None
+    pos = 0
+    end = len(data)
+    while pos < end:
+        (key, pos) = _read_varint(data, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            (value, pos) = _read_varint(data, pos)
+            if key >> 3 == 2:
+                tid = value
+        elif wire_type == 2:
+            (length, pos) = _read_varint(data, pos)
+            pos += length
+            if key >> 3 > 2:
+                number = key >> 3
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 5:
+            pos += 4
+        else:
+            raise ValueError('Unsupported wire type %d' % wire_type)
+    if pos > end:
+        raise ValueError('Truncated pdu')
+    return (tid, number)
+
+def new_event_loop():
+    """Return a new event loop, a uvloop one if uvloop is installed."""
+    if uvloop is not None:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+class BaseClient:
+    """Connection, framing and procedure coroutines shared by all clients."""
+
+    def __init__(self, host, port, user, password,
+                 batch_max_rows = 1000, batch_max_bytes = 1048576,
+                 max_in_flight = 65536, write_buffer_high = 1048576,
+                 write_buffer_low = None, flush_delay = 0,
+                 flush_bytes = 65536, reconnect = True, reconnect_delay = 0.1,
+                 reconnect_max_delay = 10, timeout = 60, debug_wire = False,
+                 lazy_rows = False, raw = None, loop = None):
         self.host = host
         self.port = port
         self.username = user
         self.password = password
+        self.batch_max_rows = batch_max_rows
+        self.batch_max_bytes = batch_max_bytes
         self.tid = 0
-        self.cid = 0
-        self.writer = None
-        self.reader = None
+        # Free correlation ids, the window of requests in flight.
+        self.free_cids = collections.deque(range(min(max_in_flight, 65536)))
+        self.cid_waiters = collections.deque()
+        self.write_buffer_high = write_buffer_high
+        if write_buffer_low is None:
+            write_buffer_low = write_buffer_high // 4
+        self.write_buffer_low = write_buffer_low
+        # Frames waiting to be written together by _flush.
+        self.flush_delay = flush_delay
+        self.flush_bytes = flush_bytes
+        self.send_buffer = []
+        self.send_buffer_size = 0
+        self.flush_handle = None
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnecting = None
+        # Resolved when a lost connection is established again.
+        self.connected = None
+        self.closing = False
+        self.transport = None
+        self.protocol = None
+        # Frames received before authentication completed.
+        self.frames = None
         self.message_dict = {}
-        self.loop = self._get_event_loop()
-        (self.reader, self.writer) = self._connect()
-        if self.reader == None or self.writer == None:
-            raise ValueError('Could not connect.')
-
-        self._auth()
-        asyncio.ensure_future(self._listener(), loop=self.loop)
-
-    def __del__(self):
-        self.cleanup()
-        self.loop.close()
-
-    def cleanup(self):
-        self._cancel_all_tasks()
-        self._disconnect()
-
-    def _cancel_all_tasks(self):
-        for task in asyncio.all_tasks(loop=self.loop):
-            task.cancel()
-
-    def _get_event_loop(self):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop
-
-    def run_loop(self):
-        logging.debug('Run loop forever.')
-        return self.loop.run_forever()
-
-    def stop_loop(self):
-        logging.debug('Stop loop.')
-        return self.loop.call_soon_threadsafe(self.loop.stop)
+        # Encoded requests that are replayed after a reconnect, by cid.
+        self.replayable = {}
+        # Cids of the frames queued on the current connection.
+        self.sent = set()
+        # Default deadline of a request in seconds.
+        self.timeout = timeout
+        self.metrics = Stats()
+        # Compiled encoders by table name.
+        self.schemas = {}
+        # Log every request and response pdu at DEBUG level.
+        self.debug_wire = debug_wire
+        # Return rows as utils.FieldsView instead of dicts.
+        self.lazy_rows = lazy_rows
+        # Return responses as 'bytes' (or True) or as 'pdu', not formatted.
+        self.raw = 'bytes' if raw is True else raw
+        # Trace hooks and the traces of requests not yet formatted, by tid.
+        self.trace_hooks = []
+        self.traces = {}
+        self.trace_pending = []
+        self.trace_start = None
+        self.timer = None
+        self.loop = loop
+
+    async def _open(self):
+        await self._establish()
+        self.timer = TimerWheel(self.loop, resolution=0.01, slots=1024)
+
+    async def _establish(self):
+        self.frames = asyncio.Queue()
+        (transport, protocol) = await self._connect()
+        transport.set_write_buffer_limits(high=self.write_buffer_high,
+                                          low=self.write_buffer_low)
+        (self.transport, self.protocol) = (transport, protocol)
+        try:
+            await self._auth()
+        except:
+            transport.close()
+            self.transport = None
+            raise
+        self.frames = None
+        # TLS 1.3 tickets arrive after the handshake, auth waited for them.
+        tls.save_session(tls.client_context(self.host, self.port), transport)
+        protocol.on_frame = self._dispatch
 
     def write_data(self, msg, timeout=0):
         length = len(msg)
         num_bytes = length.to_bytes(4, byteorder='big')
         data = b''.join([num_bytes, msg])
-        logging.debug('send bytes %s', pprint.pformat(data))
-        res = self.writer.write(data)
+        if self.debug_wire:
+            logging.debug('send bytes %s', utils.LazyFormat(data))
+        res = self.transport.write(data)
         return res
 
+    async def _send(self, cid, data, deadline, replay = False):
+        """Queue a frame and wait while the transport is over its limits.
+
+        Frames queued during one loop iteration, or within flush_delay
+        seconds, are written with a single writelines call. The queue is
+        written right away once it holds flush_bytes bytes. Waiting stops
+        when the deadline future of the request fails. A replay frame is
+        sent again if the connection is lost before its response.
+        """
+        if self.connected is not None:
+            await self._wait(asyncio.shield(self.connected), deadline)
+        if self.transport is None:
+            # Lost and not reconnecting.
+            raise ConnectionResetError('Connection lost')
+        header = struct.pack('>IH', len(data) + 2, cid)
+        self.send_buffer.append(header)
+        self.send_buffer.append(data)
+        self.send_buffer_size += len(data) + 6
+        self.metrics.bytes_sent += len(data) + 6
+        self.sent.add(cid)
+        if replay:
+            # Only queued frames, a reconnect must not send a frame that
+            # is still waiting for the connection.
+            self.replayable[cid] = data
+        if self.trace_hooks:
+            trace = self.traces.get(self.message_dict[cid][0])
+            if trace is not None:
+                trace['queued'] = clock()
+                self.trace_pending.append(trace)
+        if self.send_buffer_size >= self.flush_bytes:
+            self._flush()
+        elif self.flush_handle is None:
+            if self.flush_delay:
+                self.flush_handle = self.loop.call_later(self.flush_delay,
+                                                         self._flush)
+            else:
+                self.flush_handle = self.loop.call_soon(self._flush)
+        if self.transport.get_write_buffer_size() > self.write_buffer_high:
+            try:
+                waiter = self.protocol.drain()
+                if waiter is not None:
+                    await self._wait(waiter, deadline)
+            except ConnectionError:
+                # Pending requests are replayed or failed on reconnect.
+                pass
+
+    async def _wait(self, waiter, deadline):
+        """Await waiter, raising the error of deadline if that fails first.
+
+        The waiter is cancelled when the deadline expires, so no timer or
+        task is needed to bound the wait. If the response resolves the
+        deadline first, the wait ends and None is returned.
+        """
+        def expire(_):
+            waiter.cancel()
+        deadline.add_done_callback(expire)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if deadline.done() and not deadline.cancelled():
+                if deadline.exception() is None:
+                    # Answered while waiting for the drain.
+                    return None
+                raise deadline.exception()
+            raise
+        finally:
+            deadline.remove_done_callback(expire)
+
+    def _flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.send_buffer and self.transport is not None:
+            self.transport.writelines(self.send_buffer)
+            self.send_buffer = []
+            self.send_buffer_size = 0
+        if self.trace_pending:
+            now = clock()
+            for trace in self.trace_pending:
+                trace['written'] = now
+            self.trace_pending = []
+
+    def buffered_bytes(self):
+        """Number of bytes queued or written but not yet sent."""
+        if self.transport:
+            return (self.transport.get_write_buffer_size() +
+                    self.send_buffer_size)
+        return self.send_buffer_size
+
+    def stats(self):
+        """Return request counts, errors, bytes and latency percentiles.
+
+        requests and latency are keyed by procedure, errors by the category
+        of the error tuple. Latencies are in seconds and in_flight is the
+        number of requests waiting for a response.
+        """
+        return self.metrics.snapshot(len(self.message_dict))
+
+    def compile_schema(self, table_name, key_types, column_types = {}):
+        """Encode keys and columns of a table with compiled encoders.
+
+        key_types and column_types map field names to bool, int, bytes,
+        float or str. Requests on the table then set these fields without
+        checking the type of every value. Returns the TableSchema.
+        """
+        schema = TableSchema(table_name, key_types, column_types)
+        self.schemas[table_name] = schema
+        return schema
+
+    def prepare_read(self, table_name):
+        """Return a read of table_name with its constant bytes encoded once.
+
+        stmt = client.prepare_read(table_name)
+        stmt(key)
+
+        The operation is called like read, without the table name. It uses
+        the schema compiled for the table before it was prepared.
+        """
+        return PreparedRead(self, table_name, self.schemas.get(table_name))
+
+    def prepare_write(self, table_name):
+        """Return a prepared write of table_name, called with key, columns."""
+        return PreparedWrite(self, table_name, self.schemas.get(table_name))
+
+    def _encode_key(self, repeated, table_name, key):
+        schema = self.schemas.get(table_name)
+        if schema is None:
+            repeated.extend(utils.make_fields(key))
+        else:
+            schema.key.encode(repeated, key)
+
+    def _encode_columns(self, repeated, table_name, columns):
+        schema = self.schemas.get(table_name)
+        if schema is None:
+            repeated.extend(utils.make_fields(columns))
+        else:
+            schema.columns.encode(repeated, columns)
+
+    def add_trace_hook(self, hook):
+        """Call hook(trace) with the stage timestamps of every request.
+
+        trace is a dict holding the transaction id as tid, the procedure
+        and clock() timestamps named by pundun.tracing.STAGES. Hooks run on
+        the event loop once the response is formatted, so they should be
+        fast. Without hooks no timestamps are taken.
+        """
+        self.trace_hooks.append(hook)
+
+    def remove_trace_hook(self, hook):
+        self.trace_hooks.remove(hook)
+        if not self.trace_hooks:
+            self.traces = {}
+            self.trace_pending = []
+
     async def read_data(self, timeout = None):
+        """Return the next frame received during authentication."""
         if timeout == 0:
             timeout = None
+        frame = await asyncio.wait_for(self.frames.get(), timeout=timeout)
+        if frame is None:
+            raise ConnectionResetError('Connection lost')
+        return frame
+
+    def _auth_frame(self, frame):
+        self.frames.put_nowait(bytes(frame))
+
+    def _dispatch(self, frame):
+        """Resolve the request waiting for a response frame.
+
+        frame is a memoryview into the protocol's receive buffer, the
+        payload is parsed from it without copying.
+        """
+        if self.trace_hooks:
+            received = clock()
+        self.metrics.bytes_received += len(frame) + 4
+        (cid,) = struct.unpack_from('>H', frame)
+        (tid, fut) = self.message_dict.get(cid, (None, None))
+        if fut is None or fut.done():
+            logging.debug('no waiting future for cid: %d', cid)
+            return
+        payload = frame[2:]
         try:
-            numbytes = await asyncio.wait_for(self.reader.readexactly(4),
-                                              timeout=timeout,loop=self.loop)
-            lenght = int.from_bytes(numbytes, byteorder='big')
-            data = await asyncio.wait_for(self.reader.readexactly(lenght),
-                                          timeout=timeout, loop=self.loop)
-            return data
-
-        except CancelledError as e:
-            raise e
-        except asyncio.TimeoutError as e:
-            raise e
+            (rtid, rpdu) = self._parse(payload)
         except Exception as e:
-            err = sys.exc_info()
-            logging.warning('read error: %s', pprint.pformat(err))
-            raise e
-
-    async def _listener(self):
-        logging.info('Listener started..')
-        while self.loop.is_running():
-            logging.debug('listener looping')
+            # The traceback of e holds the payload view and would keep
+            # the receive buffer from being resized.
+            fut.set_exception(e.with_traceback(None))
+            return
+        finally:
+            payload.release()
+        if rtid != tid:
+            # Late response to an expired request whose cid was reused.
+            logging.debug('stale response tid: %d', rtid)
+            return
+        if self.trace_hooks:
+            trace = self.traces.get(tid)
+            if trace is not None:
+                trace['received'] = received
+                trace['parsed'] = clock()
+        if self.debug_wire:
+            logging.debug('response pdu: %s', utils.LazyFormat(rpdu))
+        fut.set_result(rpdu)
+
+    def _parse(self, payload):
+        """Return the transaction id and the response pdu of a payload.
+
+        With raw 'bytes' the pdu of a response is its payload, copied out
+        of the receive buffer. Errors are always parsed.
+        """
+        if self.raw == 'bytes':
+            (tid, number) = _peek_pdu(payload)
+            if number != ERROR_FIELD:
+                return (tid, payload.tobytes())
+        if not ZERO_COPY_PARSE:
+            payload = payload.tobytes()
+        rpdu = apollo.ApolloPdu()
+        rpdu.ParseFromString(payload)
+        return (rpdu.transaction_id, rpdu)
+
+    def _connection_lost(self, exc, protocol = None):
+        if protocol is not None and protocol is not self.protocol:
+            # A connection that a reconnect already replaced.
+            return
+        if self.frames is not None:
+            # Lost while authenticating, wake up read_data. _establish
+            # fails and requests wait for the next attempt.
+            self.frames.put_nowait(None)
+            return
+        if self.closing:
+            return
+        logging.warning('Connection to %s:%s lost: %s',
+                        self.host, self.port, exc)
+        self.transport = None
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.send_buffer = []
+        self.send_buffer_size = 0
+        self.trace_pending = []
+        if self.connected is None:
+            self.connected = self.loop.create_future()
+        # Sent requests that are not safe to send twice fail right away,
+        # requests waiting for the connection are sent after a reconnect.
+        lost = ConnectionResetError('Connection lost')
+        for cid in self.sent:
+            (tid, fut) = self.message_dict[cid]
+            if cid not in self.replayable and not fut.done():
+                fut.set_exception(lost)
+        self.sent = set()
+        if self.reconnect and self.reconnecting is None:
+            self.reconnecting = self.loop.create_task(self._reconnect())
+        elif not self.reconnect:
+            self._give_up(lost)
+
+    async def _reconnect(self):
+        delay = self.reconnect_delay
+        while not self.closing:
             try:
-                ciddata = await self.read_data()
-                cid = int.from_bytes(ciddata[:2], byteorder='big')
-                q = self.message_dict.get(cid, False)
-                if q:
-                    q.put_nowait(ciddata[2:])
-                    logging.debug('put q: %s', pprint.pformat(q))
-                else:
-                    logging.debug('no waiting q for cid: %d', cid)
-                continue
-            except CancelledError as e:
-                logging.info('Listener task cancelled..')
-                raise e
+                await self._establish()
                 break
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print("Exceptionasdfasd {}".format(e))
-                raise e
-            except:
-                err = sys.exc_info()
-                logging.warning('Stop listener: %s', pprint.pformat(err))
-                break
-        logging.info('Listener stopped..')
-
-    def _connect(self):
-        ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
-        connection = asyncio.open_connection(self.host,
-                                             self.port,
-                                             ssl=ctx, loop=self.loop)
-        (reader, writer) = self.loop.run_until_complete(connection)
+                logging.warning('Reconnect to %s:%s failed: %s',
+                                self.host, self.port, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max_delay)
+        self.reconnecting = None
+        if self.closing:
+            return
+        logging.info('Reconnected to %s:%s, replaying %d requests',
+                     self.host, self.port, len(self.replayable))
+        for (cid, data) in self.replayable.items():
+            header = struct.pack('>IH', len(data) + 2, cid)
+            self.send_buffer.append(header)
+            self.send_buffer.append(data)
+            self.send_buffer_size += len(data) + 6
+            self.metrics.bytes_sent += len(data) + 6
+            self.sent.add(cid)
+        self._flush()
+        (connected, self.connected) = (self.connected, None)
+        if connected is not None and not connected.done():
+            connected.set_result(True)
+
+    def _give_up(self, exc):
+        for (tid, fut) in self.message_dict.values():
+            if not fut.done():
+                fut.set_exception(exc)
+        (waiters, self.cid_waiters) = (self.cid_waiters,
+                                       collections.deque())
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(exc)
+        (connected, self.connected) = (self.connected, None)
+        if connected is not None and not connected.done():
+            connected.set_exception(exc)
+            # Waiters may already be gone, do not log an unretrieved error.
+            connected.exception()
+
+    async def _connect(self):
+        ctx = tls.client_context(self.host, self.port)
+        def protocol_factory():
+            protocol = PundunProtocol(self._auth_frame, None)
+            protocol.on_lost = lambda exc: self._connection_lost(exc,
+                                                                 protocol)
+            return protocol
+        connection = self.loop.create_connection(protocol_factory,
+                                                 self.host, self.port,
+                                                 ssl=ctx)
+        (transport, protocol) = await connection
         logging.debug('connected')
-        return (reader, writer)
+        return (transport, protocol)
 
-    def _auth(self):
+    async def _auth(self):
         logging.debug('authing')
-        authing = scram.authenticate(self.username, self.password,
-                                 streamreader = self,
-                                 streamwriter = self,
-                                 loop=self.loop)
-        res = self.loop.run_until_complete(authing)
+        res = await scram.authenticate(self.username, self.password,
+                                       streamreader = self,
+                                       streamwriter = self,
+                                       loop=self.loop)
         logging.debug('Scrampy Auth response: {}'.format(res))
 
     def _disconnect(self):
-        if self.writer:
+        self.closing = True
+        if self.reconnecting is not None:
+            self.reconnecting.cancel()
+            self.reconnecting = None
+        if self.timer:
+            self.timer.cancel()
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self._give_up(ConnectionResetError('Client closed'))
+        if self.transport:
             try:
-                return self.writer.close()
+                return self.transport.close()
             except:
                 return
         return
 
-    def create_table(self, table_name, key_def, options, do_async = False):
-        if do_async:
-            return self._run_coroutine(
-                    self._create_table(table_name, key_def, options))
-        else:
-            return self.loop.run_until_complete(
-                    self._create_table(table_name, key_def, options))
-
-    async def _create_table(self, table_name, key_def, options):
+    async def _create_table(self, table_name, key_def, options,
+                            timeout = None):
         pdu = self._make_pdu()
         pdu.create_table.table_name = table_name
         pdu.create_table.keys.extend(key_def)
         table_options = utils.make_table_options(options)
         pdu.create_table.table_options.extend(table_options)
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def delete_table(self, table_name, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._delete_table(table_name))
-        else:
-            return self.loop.run_until_complete(self._delete_table(table_name))
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    async def _delete_table(self, table_name):
+    async def _delete_table(self, table_name, timeout = None):
         pdu = self._make_pdu()
         pdu.delete_table.table_name = table_name
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def open_table(self, table_name, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._open_table(table_name))
-        else:
-            return self.loop.run_until_complete(self._open_table(table_name))
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    async def _open_table(self, table_name):
+    async def _open_table(self, table_name, timeout = None):
         pdu = self._make_pdu()
         pdu.open_table.table_name = table_name
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def close_table(self, table_name, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._close_table(table_name))
-        else:
-            return self.loop.run_until_complete(self._close_table(table_name))
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    async def _close_table(self, table_name):
+    async def _close_table(self, table_name, timeout = None):
         pdu = self._make_pdu()
         pdu.close_table.table_name = table_name
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def table_info(self, table_name, attributes = [], do_async = False):
-        if do_async:
-            return self._run_coroutine(self._table_info(table_name, attributes))
-        else:
-            return self.loop.run_until_complete(
-                    self._table_info(table_name, attributes))
-
-    async def _table_info(self, table_name, attributes):
+    async def _table_info(self, table_name, attributes, timeout = None):
         pdu = self._make_pdu()
         pdu.table_info.table_name = table_name
         pdu.table_info.attributes.extend(attributes)
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def write(self, table_name, key, columns, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._write(table_name, key, columns))
-        else:
-            return self.loop.run_until_complete(
-                    self._write(table_name, key, columns))
-
-    async def _write(self, table_name, key, columns):
+    async def _write(self, table_name, key, columns, timeout = None):
         pdu = self._make_pdu()
         pdu.write.table_name = table_name
-        key_fields = utils.make_fields(key)
-        pdu.write.key.extend(key_fields)
-        columns_fields = utils.make_fields(columns)
-        pdu.write.columns.extend(columns_fields)
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def delete(self, table_name, key, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._delete(table_name, key))
-        else:
-            return self.loop.run_until_complete(self._delete(table_name, key))
+        self._encode_key(pdu.write.key, table_name, key)
+        self._encode_columns(pdu.write.columns, table_name, columns)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    async def _delete(self, table_name, key):
+    async def _delete(self, table_name, key, timeout = None):
         pdu = self._make_pdu()
         pdu.delete.table_name = table_name
-        key_fields = utils.make_fields(key)
-        pdu.delete.key.extend(key_fields)
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def update(self, table_name, key, update_operations, do_async = False):
-        if do_async:
-            return self._run_coroutine(
-                    self._update(table_name, key, update_operations))
-        else:
-            return self.loop.run_until_complete(
-                    self._update(table_name, key, update_operations))
-
-    async def _update(self, table_name, key, update_operations):
+        self._encode_key(pdu.delete.key, table_name, key)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
+
+    async def _batch_write(self, table_name, writes, deletes, timeout = None):
+        batches = utils.make_batches(writes, deletes,
+                                     self.batch_max_rows,
+                                     self.batch_max_bytes,
+                                     self.schemas.get(table_name))
+        coros = [self._write_batch(table_name, kcps, delete_keys,
+                                   timeout)
+                 for (kcps, delete_keys) in batches]
+        return utils.first_error(await asyncio.gather(*coros))
+
+    async def _write_batch(self, table_name, kcps, delete_keys,
+                           timeout = None):
+        pdu = self._make_pdu()
+        pdu.batch_write.table_name = table_name
+        pdu.batch_write.write_kvps.extend(kcps)
+        pdu.batch_write.delete_keys.extend(delete_keys)
+        rpdu = await self._write_pdu(pdu, timeout)
+        # The results of the frames of a batch are merged by first_error.
+        return self._format(rpdu, raw = False)
+
+    async def _update(self, table_name, key, update_operations,
+                      timeout = None):
         pdu = self._make_pdu()
         pdu.update.table_name = table_name
-        key_fields = utils.make_fields(key)
-        pdu.update.key.extend(key_fields)
+        self._encode_key(pdu.update.key, table_name, key)
         uol = utils.make_update_operation_list(update_operations)
         pdu.update.update_operation.extend(uol)
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def read(self, table_name, key, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._read(table_name, key))
-        else:
-            return self.loop.run_until_complete(self._read(table_name, key))
-
-    async def _read(self, table_name, key):
+    async def _read(self, table_name, key, timeout = None):
         pdu = self._make_pdu()
         pdu.read.table_name = table_name
-        key_fields = utils.make_fields(key)
-        pdu.read.key.extend(key_fields)
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        self._encode_key(pdu.read.key, table_name, key)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def index_read(self, table_name, column_name, term, filter, do_async = False):
-        if do_async:
-            return self._run_coroutine(
-                    self._index_read(table_name, column_name, term, filter))
-        else:
-            return self.loop.run_until_complete(
-                    self._index_read(table_name, column_name, term, filter))
-
-    async def _index_read(self, table_name, column_name, term, filter):
+    async def _index_read(self, table_name, column_name, term, filter,
+                          timeout = None):
         pdu = self._make_pdu()
         pdu.index_read.table_name = table_name
         pdu.index_read.column_name = column_name
@@ -286,198 +610,207 @@ class Client:
         pdu.index_read.filter.start_ts = posting_filter.start_ts
         pdu.index_read.filter.end_ts = posting_filter.end_ts
         pdu.index_read.filter.max_postings = posting_filter.max_postings
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def read_range(self, table_name, start_key, end_key, limit, do_async = False):
-        if do_async:
-            return self._run_coroutine(
-                    self._read_range(table_name, start_key, end_key, limit))
-        else:
-            return self.loop.run_until_complete(
-                    self._read_range(table_name, start_key, end_key, limit))
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    async def _read_range(self, table_name, start_key, end_key, limit):
+    async def _read_range(self, table_name, start_key, end_key, limit,
+                          timeout = None):
         pdu = self._make_pdu()
         pdu.read_range.table_name = table_name
-        start_key_fields = utils.make_fields(start_key)
-        pdu.read_range.start_key.extend(start_key_fields)
-        end_key_fields = utils.make_fields(end_key)
-        pdu.read_range.end_key.extend(end_key_fields)
+        self._encode_key(pdu.read_range.start_key, table_name, start_key)
+        self._encode_key(pdu.read_range.end_key, table_name, end_key)
         pdu.read_range.limit = limit
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def read_range_n(self, table_name, start_key, n, do_async = False):
-        if do_async:
-            return self._run_coroutine(
-                    self._read_range_n(table_name, start_key, n))
-        else:
-            return self.loop.run_until_complete(
-                    self._read_range_n(table_name, start_key, n))
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    async def _read_range_n(self, table_name, start_key, n):
+    async def _read_range_n(self, table_name, start_key, n, timeout = None):
         pdu = self._make_pdu()
         pdu.read_range_n.table_name = table_name
-        start_key_fields = utils.make_fields(start_key)
-        pdu.read_range_n.start_key.extend(start_key_fields)
+        self._encode_key(pdu.read_range_n.start_key, table_name, start_key)
         pdu.read_range_n.n = n
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def read_range_n_ts(self, table_name, start_key, n, do_async = False):
-        if do_async:
-            return self._run_coroutine(
-                    self._read_range_n_ts(table_name, start_key, n))
-        else:
-            return self.loop.run_until_complete(
-                    self._read_range_n_ts(table_name, start_key, n))
-
-    async def _read_range_n_ts(self, table_name, start_key, n):
+    async def _read_range_n_ts(self, table_name, start_key, n, timeout = None):
         pdu = self._make_pdu()
         pdu.read_range_n_ts.table_name = table_name
-        start_key_fields = utils.make_fields(start_key)
-        pdu.read_range_n_ts.start_key.extend(start_key_fields)
+        self._encode_key(pdu.read_range_n_ts.start_key, table_name, start_key)
         pdu.read_range_n_ts.n = n
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def first(self, table_name, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._first(table_name))
-        else:
-            return self.loop.run_until_complete(self._first(table_name))
-
-    async def _first(self, table_name):
+    async def _first(self, table_name, timeout = None):
         pdu = self._make_pdu()
         pdu.first.table_name = table_name
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def last(self, table_name, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._last(table_name))
-        else:
-            return self.loop.run_until_complete(self._last(table_name))
-
-    async def _last(self, table_name):
+    async def _last(self, table_name, timeout = None):
         pdu = self._make_pdu()
         pdu.last.table_name = table_name
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def seek(self, table_name, key, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._seek(table_name, key))
-        else:
-            return self.loop.run_until_complete(self._seek(table_name, key))
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    async def _seek(self, table_name, key):
+    async def _seek(self, table_name, key, timeout = None):
         pdu = self._make_pdu()
         pdu.seek.table_name = table_name
-        key_fields = utils.make_fields(key)
-        pdu.seek.key.extend(key_fields)
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def next(self, it, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._next(it))
-        else:
-            return self.loop.run_until_complete(self._next(it))
+        self._encode_key(pdu.seek.key, table_name, key)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    async def _next(self, it):
+    async def _next(self, it, timeout = None):
         pdu = self._make_pdu()
         pdu.next.it = it
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def prev(self, it, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._prev(it))
-        else:
-            return self.loop.run_until_complete(self._prev(it))
-
-    async def _prev(self, it):
+    async def _prev(self, it, timeout = None):
         pdu = self._make_pdu()
         pdu.prev.it = it
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def add_index(self, table_name, config, do_async = False):
-        if do_async:
-            return self.loop._run_coroutine(
-                    self._add_index(table_name, config))
-        else:
-            return self.loop.run_until_complete(
-                    self._add_index(table_name, config))
-
-    async def _add_index(self, table_name, config):
+    async def _add_index(self, table_name, config, timeout = None):
         pdu = self._make_pdu()
         pdu.add_index.table_name = table_name
         pdu.add_index.config.extend(utils.make_index_config_list(config))
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def remove_index(self, table_name, columns, do_async = False):
-        if do_async:
-            return self._run_coroutine(
-                    self._remove_index(table_name, columns))
-        else:
-            return self.loop.run_until_complete(
-                    self._remove_index(table_name, columns))
-
-    async def _remove_index(self, table_name, columns):
+    async def _remove_index(self, table_name, columns, timeout = None):
         pdu = self._make_pdu()
         pdu.remove_index.table_name = table_name
         pdu.remove_index.columns.extend(columns)
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
-    def list_tables(self, do_async = False):
-        if do_async:
-            return self._run_coroutine(self._list_tables())
-        else:
-            return self.loop.run_until_complete(self._list_tables())
-
-    async def _list_tables(self):
+    async def _list_tables(self, timeout = None):
         pdu = self._make_pdu()
         pdu.list_tables.SetInParent()
-        rpdu = await self._write_pdu(pdu)
-        return utils.format_rpdu(rpdu)
-
-    def _run_coroutine(self, coro):
-        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+        rpdu = await self._write_pdu(pdu, timeout)
+        return self._format(rpdu)
 
     def _make_pdu(self):
+        if self.trace_hooks:
+            # Procedures build and pass the pdu to _write_pdu without
+            # suspending, so this is the start of the next request.
+            self.trace_start = clock()
         pdu = apollo.ApolloPdu()
         pdu.version.major = 0
         pdu.version.minor = 1
         return pdu
 
-    async def _write_pdu(self, pdu):
-        pdu.transaction_id = self._get_tid()
-        logging.debug('pdu: %s', pprint.pformat(pdu))
+    async def _write_pdu(self, pdu, timeout = None):
+        """Send a request and return its response pdu."""
+        tid = self._get_tid()
+        pdu.transaction_id = tid
+        procedure = pdu.WhichOneof('procedure')
+        trace = self._start_trace(tid, procedure)
         data = pdu.SerializeToString()
-        logging.debug('encoded pdu: %s', pprint.pformat(data))
-        cid = self._get_cid()
-        cid_bytes = cid.to_bytes(2, byteorder='big')
-        logging.debug('cid_bytes: %s', pprint.pformat(cid_bytes))
-        msg = b''.join([cid_bytes, data])
-        self.write_data(msg)
-        q = asyncio.Queue(maxsize = 1, loop=self.loop)
-        self.message_dict[cid] = q
-        coro = asyncio.Task(q.get(), loop=self.loop)
-        rpdu = apollo.ApolloPdu()
+        if self.debug_wire:
+            logging.debug('pdu: %s', utils.LazyFormat(pdu))
+        return await self._request(tid, procedure, data, timeout, trace)
+
+    async def _execute(self, operation, args, timeout = None):
+        """Send a prepared operation and return its formatted response."""
+        if self.trace_hooks:
+            self.trace_start = clock()
+        tid = self._get_tid()
+        trace = self._start_trace(tid, operation.procedure)
+        data = operation.encode(tid, *args)
+        rpdu = await self._request(tid, operation.procedure, data, timeout,
+                                   trace)
+        return self._format(rpdu)
+
+    def _start_trace(self, tid, procedure):
+        if not self.trace_hooks:
+            return None
+        trace = {'tid': tid, 'procedure': procedure,
+                 'build': self.trace_start, 'encode': clock()}
+        self.traces[tid] = trace
+        return trace
+
+    async def _request(self, tid, procedure, data, timeout, trace):
+        """Send an encoded request pdu and return its response pdu.
+
+        The deadline, timeout seconds or the client's default, covers
+        waiting for a cid, for a reconnect, for drain and for the response.
+        An expired request releases its cid at once.
+        """
+        if self.debug_wire:
+            logging.debug('encoded pdu: %s', utils.LazyFormat(data))
+        if trace is not None:
+            trace['encoded'] = clock()
+        if timeout is None:
+            timeout = self.timeout
+        start = self.loop.time()
+        fut = self.loop.create_future()
+        slot = self.timer.schedule(timeout, fut)
+        cid = None
+        rpdu = None
         try:
-            rdata = await asyncio.wait_for(coro, timeout=60, loop=self.loop)
-            logging.debug('received data: %s', pprint.pformat(rdata))
-            rpdu.ParseFromString(rdata)
+            cid = await self._acquire_cid(fut)
+            if self.debug_wire:
+                logging.debug('cid: %d', cid)
+            self.message_dict[cid] = (tid, fut)
+            await self._send(cid, data, fut,
+                             procedure in IDEMPOTENT_PROCEDURES)
+            rpdu = await fut
         except asyncio.TimeoutError:
+            rpdu = apollo.ApolloPdu()
+            rpdu.transaction_id = tid
             rpdu.error.transport = 'timeout'
-        del self.message_dict[cid]
+        except ConnectionError:
+            rpdu = apollo.ApolloPdu()
+            rpdu.transaction_id = tid
+            rpdu.error.transport = 'connection_lost'
+        finally:
+            self.timer.remove(slot, fut)
+            if cid is not None:
+                del self.message_dict[cid]
+                self.replayable.pop(cid, None)
+                self.sent.discard(cid)
+                self._release_cid(cid)
+            if rpdu is None and self.traces:
+                # Cancelled, the response is never formatted.
+                self.traces.pop(tid, None)
+        self.metrics.record(procedure, self.loop.time() - start, rpdu)
         return rpdu
 
+    def _format(self, rpdu, raw = None):
+        """Return the result of a response pdu.
+
+        Responses are returned as they are with the raw option, or with
+        raw given here, errors are formatted in every mode.
+        """
+        if raw is None:
+            raw = self.raw
+        if type(rpdu) is bytes:
+            # Left encoded by _parse, so not an error.
+            if raw == 'bytes':
+                res = rpdu
+            else:
+                res = utils.format_rpdu(apollo.ApolloPdu.FromString(rpdu),
+                                        self.lazy_rows)
+        elif raw == 'pdu' and not rpdu.HasField('error'):
+            res = rpdu
+        else:
+            res = utils.format_rpdu(rpdu, self.lazy_rows)
+        if self.trace_hooks:
+            if type(rpdu) is bytes:
+                (tid, _) = _peek_pdu(rpdu)
+            else:
+                tid = rpdu.transaction_id
+            trace = self.traces.pop(tid, None)
+            if trace is not None:
+                trace['formatted'] = clock()
+                for hook in self.trace_hooks:
+                    try:
+                        hook(trace)
+                    except Exception:
+                        logging.exception('Trace hook failed')
+        return res
+
     def _get_tid(self):
         tid = self.tid
         if self.tid == 4294967295:
@@ -486,10 +819,365 @@ class Client:
             self.tid += 1
         return tid
 
-    def _get_cid(self):
-        cid = self.cid
-        if self.cid == 65535:
-            self.cid = 0
+    async def _acquire_cid(self, deadline):
+        if self.free_cids:
+            return self.free_cids.popleft()
+        # The window is full, wait for a cid released by a response.
+        waiter = self.loop.create_future()
+        self.cid_waiters.append(waiter)
+        try:
+            return await self._wait(waiter, deadline)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if waiter.done() and not waiter.cancelled():
+                self._release_cid(waiter.result())
+            raise
+
+    def _release_cid(self, cid):
+        while self.cid_waiters:
+            waiter = self.cid_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(cid)
+                return
+        self.free_cids.append(cid)
+
+class _Waiter:
+    """Result of a coroutine that a calling thread blocks on.
+
+    Lighter than concurrent.futures.Future, the caller waits on a lock
+    that the I/O thread releases when the task is done.
+    """
+
+    __slots__ = ('lock', 'result', 'exception')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lock.acquire()
+        self.result = None
+        self.exception = None
+
+    def task_done(self, task):
+        if task.cancelled():
+            self.exception = asyncio.CancelledError()
+        else:
+            self.exception = task.exception()
+            if self.exception is None:
+                self.result = task.result()
+        self.lock.release()
+
+    def wait(self):
+        self.lock.acquire()
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+class Client(BaseClient):
+    """Client class including pundun procedures.
+
+    With io_thread = True the client runs its event loop in a background
+    thread of its own and may be shared by any number of threads. Their
+    synchronous calls are handed to the I/O thread and block until the
+    response arrives.
+    """
+
+    def __init__(self, host, port, user, password, loop = None,
+                 io_thread = False, loop_factory = new_event_loop, **options):
+        logging.info('Client setup..')
+        super().__init__(host, port, user, password, loop = loop, **options)
+        self.own_loop = loop is None
+        self.loop_factory = loop_factory
+        self.io_thread = None
+        # Held while a call is handed to the I/O thread, so that none is
+        # handed over after cleanup.
+        self.io_lock = threading.Lock()
+        self.io_closed = False
+        if io_thread:
+            if not self.own_loop:
+                raise ValueError('io_thread needs a loop of its own')
+            self.loop = loop_factory()
+            self.io_thread = threading.Thread(target=self._run_io_thread,
+                                              name='pundun-io', daemon=True)
+            self.io_thread.start()
+        elif self.own_loop:
+            self.loop = self._get_event_loop()
+        self._run_sync(self._open())
+
+    def __del__(self):
+        self.cleanup()
+        if self.own_loop:
+            self.loop.close()
+
+    def cleanup(self):
+        if self.io_thread is not None:
+            with self.io_lock:
+                self.io_closed = True
+            if self.io_thread.is_alive():
+                self.loop.call_soon_threadsafe(self._shutdown)
+                self.io_thread.join()
+            return
+        self._cancel_all_tasks()
+        self._disconnect()
+
+    def _run_io_thread(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        tasks = asyncio.all_tasks(loop=self.loop)
+        if not tasks:
+            return
+        # The requests were failed by _disconnect and return their
+        # transport errors, what is left after a moment is cancelled.
+        (_, pending) = self.loop.run_until_complete(
+                asyncio.wait(tasks, timeout = 1))
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.loop.run_until_complete(
+                    asyncio.gather(*pending, return_exceptions=True))
+
+    def _shutdown(self):
+        self._disconnect()
+        self.loop.stop()
+
+    def _check_io_thread(self):
+        if (self.io_closed or not self.io_thread.is_alive() or
+                self.loop.is_closed()):
+            raise RuntimeError('Client is closed')
+
+    def _run_sync(self, coro):
+        """Run coro on the client's loop and return its result."""
+        if self.io_thread is None:
+            return self.loop.run_until_complete(coro)
+        if threading.get_ident() == self.io_thread.ident:
+            coro.close()
+            raise RuntimeError('Synchronous call from the I/O thread')
+        waiter = _Waiter()
+        # call_soon_threadsafe appends to the loop's ready queue and wakes
+        # it up, the I/O thread takes io_lock only on cleanup.
+        with self.io_lock:
+            try:
+                self._check_io_thread()
+            except RuntimeError:
+                coro.close()
+                raise
+            self.loop.call_soon_threadsafe(self._start, coro, waiter)
+        return waiter.wait()
+
+    def _start(self, coro, waiter):
+        self.loop.create_task(coro).add_done_callback(waiter.task_done)
+
+    def _cancel_all_tasks(self):
+        if not self.own_loop:
+            # The loop is shared with other clients.
+            return
+        for task in asyncio.all_tasks(loop=self.loop):
+            task.cancel()
+
+    def _get_event_loop(self):
+        loop = self.loop_factory()
+        asyncio.set_event_loop(loop)
+        return loop
+
+    def run_loop(self):
+        logging.debug('Run loop forever.')
+        return self.loop.run_forever()
+
+    def stop_loop(self):
+        logging.debug('Stop loop.')
+        return self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def pipeline(self):
+        """Return a Pipeline sending its calls to this client in one burst."""
+        return Pipeline(self)
+
+    def create_table(self, table_name, key_def, options, do_async = False,
+                     timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._create_table(table_name, key_def, options, timeout))
+        else:
+            return self._run_sync(
+                    self._create_table(table_name, key_def, options, timeout))
+
+    def delete_table(self, table_name, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._delete_table(table_name, timeout))
+        else:
+            return self._run_sync(self._delete_table(table_name, timeout))
+
+    def open_table(self, table_name, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._open_table(table_name, timeout))
+        else:
+            return self._run_sync(self._open_table(table_name, timeout))
+
+    def close_table(self, table_name, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._close_table(table_name, timeout))
+        else:
+            return self._run_sync(self._close_table(table_name, timeout))
+
+    def table_info(self, table_name, attributes = [], do_async = False,
+                   timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._table_info(table_name, attributes, timeout))
+        else:
+            return self._run_sync(
+                    self._table_info(table_name, attributes, timeout))
+
+    def write(self, table_name, key, columns, do_async = False,
+              timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._write(table_name, key, columns, timeout))
+        else:
+            return self._run_sync(
+                    self._write(table_name, key, columns, timeout))
+
+    def delete(self, table_name, key, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._delete(table_name, key, timeout))
         else:
-            self.cid += 1
-        return cid
+            return self._run_sync(self._delete(table_name, key, timeout))
+
+    def batch_write(self, table_name, writes, deletes = [], do_async = False,
+                    timeout = None):
+        """Write and delete many rows with as few round trips as possible.
+
+        writes is a list of (key, columns) pairs and deletes a list of keys.
+        The rows are split into BatchWrite frames of at most batch_max_rows
+        rows and batch_max_bytes encoded bytes, which are sent concurrently.
+        No ordering is guaranteed between frames. Returns True if all frames
+        succeeded, otherwise the first error.
+        """
+        if do_async:
+            return self._run_coroutine(
+                    self._batch_write(table_name, writes, deletes, timeout))
+        else:
+            return self._run_sync(
+                    self._batch_write(table_name, writes, deletes, timeout))
+
+    def update(self, table_name, key, update_operations, do_async = False,
+               timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._update(table_name, key, update_operations, timeout))
+        else:
+            return self._run_sync(
+                    self._update(table_name, key, update_operations, timeout))
+
+    def read(self, table_name, key, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._read(table_name, key, timeout))
+        else:
+            return self._run_sync(self._read(table_name, key, timeout))
+
+    def index_read(self, table_name, column_name, term, filter,
+                   do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._index_read(table_name, column_name, term, filter,
+                                     timeout))
+        else:
+            return self._run_sync(
+                    self._index_read(table_name, column_name, term, filter,
+                                     timeout))
+
+    def read_range(self, table_name, start_key, end_key, limit,
+                   do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._read_range(table_name, start_key, end_key, limit,
+                                     timeout))
+        else:
+            return self._run_sync(
+                    self._read_range(table_name, start_key, end_key, limit,
+                                     timeout))
+
+    def read_range_n(self, table_name, start_key, n, do_async = False,
+                     timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._read_range_n(table_name, start_key, n, timeout))
+        else:
+            return self._run_sync(
+                    self._read_range_n(table_name, start_key, n, timeout))
+
+    def read_range_n_ts(self, table_name, start_key, n, do_async = False,
+                        timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._read_range_n_ts(table_name, start_key, n, timeout))
+        else:
+            return self._run_sync(
+                    self._read_range_n_ts(table_name, start_key, n, timeout))
+
+    def first(self, table_name, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._first(table_name, timeout))
+        else:
+            return self._run_sync(self._first(table_name, timeout))
+
+    def last(self, table_name, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._last(table_name, timeout))
+        else:
+            return self._run_sync(self._last(table_name, timeout))
+
+    def seek(self, table_name, key, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._seek(table_name, key, timeout))
+        else:
+            return self._run_sync(self._seek(table_name, key, timeout))
+
+    def next(self, it, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._next(it, timeout))
+        else:
+            return self._run_sync(self._next(it, timeout))
+
+    def prev(self, it, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._prev(it, timeout))
+        else:
+            return self._run_sync(self._prev(it, timeout))
+
+    def add_index(self, table_name, config, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._add_index(table_name, config, timeout))
+        else:
+            return self._run_sync(self._add_index(table_name, config, timeout))
+
+    def remove_index(self, table_name, columns, do_async = False,
+                     timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._remove_index(table_name, columns, timeout))
+        else:
+            return self._run_sync(
+                    self._remove_index(table_name, columns, timeout))
+
+    def list_tables(self, do_async = False, timeout = None):
+        if do_async:
+            return self._run_coroutine(self._list_tables(timeout))
+        else:
+            return self._run_sync(self._list_tables(timeout))
+
+    def _call_prepared(self, operation, args, do_async = False,
+                       timeout = None):
+        if do_async:
+            return self._run_coroutine(
+                    self._execute(operation, args, timeout))
+        else:
+            return self._run_sync(self._execute(operation, args, timeout))
+
+    def _run_coroutine(self, coro):
+        if self.io_thread is None:
+            return asyncio.run_coroutine_threadsafe(coro, self.loop)
+        with self.io_lock:
+            try:
+                self._check_io_thread()
+            except RuntimeError:
+                coro.close()
+                raise
+            return asyncio.run_coroutine_threadsafe(coro, self.loop)
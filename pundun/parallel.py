@@ -0,0 +1,159 @@
+# vim: set expandtab:
+import asyncio
+import collections
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import threading
+import zlib
+
+from pundun.client import Client
+
+def _partition_key(args):
+    """Return the bytes that choose the worker of a call, or None.
+
+    Calls on a key, like write, read, update or read_range, pass a table
+    name and then a key dict. Calls on the same key go to the same worker.
+    """
+    if len(args) > 1 and isinstance(args[1], dict):
+        return repr(sorted(args[1].items())).encode()
+    return None
+
+async def _run_chunk(client, chunk):
+    coros = [getattr(client, '_' + procedure)(*args)
+             for (procedure, args) in chunk]
+    return await asyncio.gather(*coros, return_exceptions=True)
+
+def _receive(conn, chunks):
+    try:
+        while True:
+            chunk = conn.recv()
+            chunks.put(chunk)
+            if chunk is None:
+                return
+    except EOFError:
+        chunks.put(None)
+
+def _worker(conn, host, port, user, password, options):
+    client = Client(host, port, user, password, **options)
+    # Chunks are read ahead by a thread, so the parent never blocks on a
+    # full pipe while this process blocks sending its results.
+    chunks = queue.Queue()
+    threading.Thread(target=_receive, args=(conn, chunks),
+                     daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            conn.send(client._run_sync(_run_chunk(client, chunk)))
+    finally:
+        client.cleanup()
+        conn.close()
+
+class ParallelExecutor:
+    """Procedure calls spread over worker processes with a Client each.
+
+    with ParallelExecutor(host, port, user, password) as executor:
+        executor.map('write', [(table_name, key, columns), ...])
+        executor.map('read', [(table_name, key), ...])
+
+    Encoding and decoding run in the workers, so they use as many cores as
+    there are processes. Calls are assigned to workers by a crc32 hash of
+    their key, calls without a key in turn. Every worker gets chunks of
+    chunk_size calls, sent concurrently on its connection, and returns
+    their results through a pipe. Results keep the order of the calls and
+    are the formatted reply, an error tuple or the raised exception.
+
+    Iterators of first, last and seek belong to the connection of one
+    worker, next and prev must be called on a Client instead.
+    """
+
+    def __init__(self, host, port, user, password, processes = None,
+                 chunk_size = 1000, window = 2, context = None, **options):
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.window = window
+        ctx = multiprocessing.get_context(context)
+        self.conns = []
+        self.workers = []
+        for _ in range(self.processes):
+            (conn, child_conn) = ctx.Pipe()
+            worker = ctx.Process(target=_worker,
+                                 args=(child_conn, host, port, user,
+                                       password, options),
+                                 daemon=True)
+            worker.start()
+            child_conn.close()
+            self.conns.append(conn)
+            self.workers.append(worker)
+        logging.info('ParallelExecutor started %d workers', self.processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.join()
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
+        self.workers = []
+
+    def map(self, procedure, calls):
+        """Call procedure with every tuple of arguments in calls."""
+        return self.execute((procedure, args) for args in calls)
+
+    def execute(self, calls):
+        """Run (procedure, args) pairs, possibly of different procedures."""
+        chunks = [collections.deque() for _ in self.conns]
+        buffers = [[] for _ in self.conns]
+        count = 0
+        for (index, (procedure, args)) in enumerate(calls):
+            key = _partition_key(args)
+            if key is None:
+                worker = index % len(self.conns)
+            else:
+                worker = zlib.crc32(key) % len(self.conns)
+            buffers[worker].append((index, procedure, args))
+            if len(buffers[worker]) >= self.chunk_size:
+                chunks[worker].append(buffers[worker])
+                buffers[worker] = []
+            count += 1
+        for (worker, buf) in enumerate(buffers):
+            if buf:
+                chunks[worker].append(buf)
+        results = [None] * count
+        # Indexes of the chunks sent to a worker, in sending order.
+        sent = dict((conn, collections.deque()) for conn in self.conns)
+        for (worker, conn) in enumerate(self.conns):
+            for _ in range(self.window):
+                self._send_chunk(conn, chunks[worker], sent[conn])
+        busy = [conn for conn in self.conns if sent[conn]]
+        while busy:
+            for conn in multiprocessing.connection.wait(busy):
+                indexes = sent[conn].popleft()
+                for (index, result) in zip(indexes, conn.recv()):
+                    results[index] = result
+                worker = self.conns.index(conn)
+                self._send_chunk(conn, chunks[worker], sent[conn])
+                if not sent[conn]:
+                    busy.remove(conn)
+        return results
+
+    def _send_chunk(self, conn, chunks, sent):
+        if chunks:
+            chunk = chunks.popleft()
+            conn.send([(procedure, args) for (_, procedure, args) in chunk])
+            sent.append([index for (index, _, _) in chunk])
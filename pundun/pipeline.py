@@ -0,0 +1,120 @@
+# vim: set expandtab:
+import asyncio
+
+class Pipeline:
+    """Procedure calls of a Client sent in one burst.
+
+    with client.pipeline() as p:
+        p.write(table_name, key, columns)
+        p.read(table_name, key)
+    p.results
+
+    Calls are only queued and return their position in results. When the
+    block exits, or on execute(), all queued requests are encoded and sent
+    together and their replies are awaited together. results holds one
+    entry per call in call order: the formatted reply, an error tuple or
+    the exception raised by that call.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.execute()
+        return False
+
+    def execute(self):
+        calls = self.calls
+        self.calls = []
+        coros = [getattr(self.client, procedure)(*args)
+                 for (procedure, args) in calls]
+        self.results = self.client._run_sync(self._gather(coros))
+        return self.results
+
+    async def _gather(self, coros):
+        # Gathered on the client's loop, which may run in its I/O thread.
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+    def _queue(self, procedure, *args):
+        self.calls.append((procedure, args))
+        return len(self.calls) - 1
+
+    def create_table(self, table_name, key_def, options, timeout = None):
+        return self._queue('_create_table', table_name, key_def, options,
+                           timeout)
+
+    def delete_table(self, table_name, timeout = None):
+        return self._queue('_delete_table', table_name, timeout)
+
+    def open_table(self, table_name, timeout = None):
+        return self._queue('_open_table', table_name, timeout)
+
+    def close_table(self, table_name, timeout = None):
+        return self._queue('_close_table', table_name, timeout)
+
+    def table_info(self, table_name, attributes = [], timeout = None):
+        return self._queue('_table_info', table_name, attributes, timeout)
+
+    def write(self, table_name, key, columns, timeout = None):
+        return self._queue('_write', table_name, key, columns, timeout)
+
+    def delete(self, table_name, key, timeout = None):
+        return self._queue('_delete', table_name, key, timeout)
+
+    def batch_write(self, table_name, writes, deletes = [], timeout = None):
+        return self._queue('_batch_write', table_name, writes, deletes,
+                           timeout)
+
+    def update(self, table_name, key, update_operations, timeout = None):
+        return self._queue('_update', table_name, key, update_operations,
+                           timeout)
+
+    def read(self, table_name, key, timeout = None):
+        return self._queue('_read', table_name, key, timeout)
+
+    def index_read(self, table_name, column_name, term, filter,
+                   timeout = None):
+        return self._queue('_index_read', table_name, column_name, term,
+                           filter, timeout)
+
+    def read_range(self, table_name, start_key, end_key, limit,
+                   timeout = None):
+        return self._queue('_read_range', table_name, start_key, end_key,
+                           limit, timeout)
+
+    def read_range_n(self, table_name, start_key, n, timeout = None):
+        return self._queue('_read_range_n', table_name, start_key, n, timeout)
+
+    def read_range_n_ts(self, table_name, start_key, n, timeout = None):
+        return self._queue('_read_range_n_ts', table_name, start_key, n,
+                           timeout)
+
+    def first(self, table_name, timeout = None):
+        return self._queue('_first', table_name, timeout)
+
+    def last(self, table_name, timeout = None):
+        return self._queue('_last', table_name, timeout)
+
+    def seek(self, table_name, key, timeout = None):
+        return self._queue('_seek', table_name, key, timeout)
+
+    def next(self, it, timeout = None):
+        return self._queue('_next', it, timeout)
+
+    def prev(self, it, timeout = None):
+        return self._queue('_prev', it, timeout)
+
+    def add_index(self, table_name, config, timeout = None):
+        return self._queue('_add_index', table_name, config, timeout)
+
+    def remove_index(self, table_name, columns, timeout = None):
+        return self._queue('_remove_index', table_name, columns, timeout)
+
+    def list_tables(self, timeout = None):
+        return self._queue('_list_tables', timeout)
@@ -0,0 +1,442 @@
+# vim: set expandtab:
+import asyncio
+import logging
+
+from pundun import apollo_pb2 as apollo
+from pundun.client import Client, new_event_loop
+from pundun.prepared import PreparedRead, PreparedWrite
+from pundun.stats import Histogram, Stats
+from pundun import utils
+
+# Procedures that may be sent twice, to another connection, by hedging.
+HEDGED_PROCEDURES = frozenset(['_read', '_read_range', '_read_range_n',
+                               '_read_range_n_ts', '_index_read',
+                               '_table_info'])
+
+class HedgeDelay:
+    """Latency percentile of the last window first sends of a procedure.
+
+    Only the latency of the first send of a request is recorded, a hedge
+    that wins would pull the percentile down. Hedges are limited to
+    max_rate of the requests of the current window.
+    """
+
+    def __init__(self, percentile, window, max_rate):
+        self.percentile = percentile
+        self.window = window
+        self.max_rate = max_rate
+        self.histogram = Histogram()
+        # None until the first window is complete.
+        self.delay = None
+        # Requests and hedges of the current window.
+        self.requests = 0
+        self.hedges = 0
+
+    def record(self, seconds):
+        histogram = self.histogram
+        histogram.record(int(seconds * 1e6))
+        if histogram.count >= self.window:
+            self.delay = histogram.percentile(self.percentile) / 1e6
+            self.histogram = Histogram()
+            (self.requests, self.hedges) = (0, 0)
+
+    def allow_hedge(self):
+        """Count a hedge and return True if it stays within max_rate."""
+        if self.hedges + 1 > self.max_rate * self.requests:
+            return False
+        self.hedges += 1
+        return True
+
+class Endpoint:
+    """Connections to one node and the health of that node."""
+
+    def __init__(self, host, port, clients, latency):
+        self.host = host
+        self.port = port
+        self.clients = clients
+        # Moving average of response times in seconds.
+        self.latency = latency
+        self.ejected = False
+        self.probe = None
+
+    def observe(self, seconds, alpha):
+        self.latency += alpha * (seconds - self.latency)
+
+class ClientPool:
+    """Pool of authenticated connections with the procedures of Client.
+
+    host is a host name, or a list of (host, port) pairs of cluster nodes
+    in which case port is not used. size connections are opened to every
+    node and all connections share one event loop.
+
+    Each request is sent on the connection with the lowest moving average
+    of response times of its node multiplied by its requests in flight.
+    A node whose request times out or loses its connection is ejected and
+    gets no requests until a list_tables probe, sent every probe_interval
+    seconds, succeeds. Iterators returned by first, last and seek are
+    pinned to the connection that created them so that next and prev reach
+    the same server side process.
+
+    With hedge_percentile set, a read-only request that got no response
+    within that percentile of the last hedge_window response times of its
+    procedure is sent again on another connection, preferably of another
+    node. The first response is returned and the other request cancelled.
+    At most hedge_max_rate of the requests are hedged, by default the
+    100 - hedge_percentile percent a steady latency would hedge.
+    """
+
+    def __init__(self, host, port, user, password, size = 4,
+                 loop_factory = new_event_loop, latency_alpha = 0.2,
+                 probe_interval = 1, probe_timeout = 1,
+                 hedge_percentile = None, hedge_window = 1000,
+                 hedge_max_rate = None, **kwargs):
+        if isinstance(host, str):
+            addresses = [(host, port)]
+        else:
+            addresses = list(host)
+        logging.info('ClientPool setup with %d connections to %d nodes..',
+                     size, len(addresses))
+        self.loop = loop_factory()
+        asyncio.set_event_loop(self.loop)
+        self.latency_alpha = latency_alpha
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_window = hedge_window
+        if hedge_max_rate is None and hedge_percentile is not None:
+            hedge_max_rate = (100 - hedge_percentile) / 100
+        self.hedge_max_rate = hedge_max_rate
+        self.hedge_delays = {}
+        self.endpoints = []
+        self.endpoint_of = {}
+        self.clients = []
+        for (node_host, node_port) in addresses:
+            clients = [Client(node_host, node_port, user, password,
+                              loop = self.loop, **kwargs)
+                       for _ in range(size)]
+            endpoint = Endpoint(node_host, node_port, clients, 0.001)
+            self.endpoints.append(endpoint)
+            for client in clients:
+                self.endpoint_of[client] = endpoint
+            self.clients.extend(clients)
+        self.iterators = {}
+
+    def __del__(self):
+        self.cleanup()
+        self.loop.close()
+
+    def cleanup(self):
+        tasks = [e.probe for e in self.endpoints if e.probe is not None]
+        tasks.extend(c.reconnecting for c in self.clients
+                     if c.reconnecting is not None)
+        for client in self.clients:
+            client.cleanup()
+        for task in tasks:
+            task.cancel()
+        if tasks and not self.loop.is_running():
+            # Let the cancelled tasks finish before the loop is closed.
+            self.loop.run_until_complete(
+                    asyncio.gather(*tasks, return_exceptions=True))
+        self.clients = []
+        self.endpoints = []
+        self.endpoint_of = {}
+        self.iterators = {}
+
+    def run_loop(self):
+        logging.debug('Run pool loop forever.')
+        return self.loop.run_forever()
+
+    def stop_loop(self):
+        logging.debug('Stop pool loop.')
+        return self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def stats(self):
+        """Return the stats of Client.stats summed over all connections."""
+        total = Stats()
+        for client in self.clients:
+            total.merge(client.metrics)
+        in_flight = sum(len(client.message_dict) for client in self.clients)
+        return total.snapshot(in_flight)
+
+    def compile_schema(self, table_name, key_types, column_types = {}):
+        """Compile encoders of a table on every connection."""
+        for client in self.clients:
+            schema = client.compile_schema(table_name, key_types,
+                                           column_types)
+        return schema
+
+    def prepare_read(self, table_name):
+        """Return a prepared read, see Client.prepare_read."""
+        schema = self.clients[0].schemas.get(table_name)
+        return PreparedRead(self, table_name, schema)
+
+    def prepare_write(self, table_name):
+        """Return a prepared write, see Client.prepare_write."""
+        schema = self.clients[0].schemas.get(table_name)
+        return PreparedWrite(self, table_name, schema)
+
+    def health(self):
+        """Return host, port, latency and ejected state of every node."""
+        return [{'host': e.host, 'port': e.port, 'latency': e.latency,
+                 'ejected': e.ejected}
+                for e in self.endpoints]
+
+    def add_trace_hook(self, hook):
+        """Add a trace hook to every connection, see Client.add_trace_hook."""
+        for client in self.clients:
+            client.add_trace_hook(hook)
+
+    def remove_trace_hook(self, hook):
+        for client in self.clients:
+            client.remove_trace_hook(hook)
+
+    def create_table(self, table_name, key_def, options, do_async = False,
+                     timeout = None):
+        return self._run(self._dispatch('_create_table', table_name,
+                                        key_def, options, timeout), do_async)
+
+    def delete_table(self, table_name, do_async = False, timeout = None):
+        return self._run(self._dispatch('_delete_table', table_name,
+                                        timeout), do_async)
+
+    def open_table(self, table_name, do_async = False, timeout = None):
+        return self._run(self._dispatch('_open_table', table_name,
+                                        timeout), do_async)
+
+    def close_table(self, table_name, do_async = False, timeout = None):
+        return self._run(self._dispatch('_close_table', table_name,
+                                        timeout), do_async)
+
+    def table_info(self, table_name, attributes = [], do_async = False,
+                   timeout = None):
+        return self._run(self._dispatch('_table_info', table_name,
+                                        attributes, timeout), do_async)
+
+    def write(self, table_name, key, columns, do_async = False,
+              timeout = None):
+        return self._run(self._dispatch('_write', table_name, key, columns,
+                                        timeout), do_async)
+
+    def delete(self, table_name, key, do_async = False, timeout = None):
+        return self._run(self._dispatch('_delete', table_name, key, timeout),
+                         do_async)
+
+    def batch_write(self, table_name, writes, deletes = [], do_async = False,
+                    timeout = None):
+        return self._run(self._batch_write(table_name, writes, deletes,
+                                           timeout), do_async)
+
+    async def _batch_write(self, table_name, writes, deletes, timeout):
+        client = self.clients[0]
+        batches = utils.make_batches(writes, deletes,
+                                     client.batch_max_rows,
+                                     client.batch_max_bytes,
+                                     client.schemas.get(table_name))
+        coros = [self._dispatch('_write_batch', table_name, kcps, delete_keys,
+                                timeout)
+                 for (kcps, delete_keys) in batches]
+        return utils.first_error(await asyncio.gather(*coros))
+
+    def update(self, table_name, key, update_operations, do_async = False,
+               timeout = None):
+        return self._run(self._dispatch('_update', table_name, key,
+                                        update_operations, timeout), do_async)
+
+    def read(self, table_name, key, do_async = False, timeout = None):
+        return self._run(self._dispatch('_read', table_name, key, timeout),
+                         do_async)
+
+    def index_read(self, table_name, column_name, term, filter,
+                   do_async = False, timeout = None):
+        return self._run(self._dispatch('_index_read', table_name,
+                                        column_name, term, filter, timeout),
+                         do_async)
+
+    def read_range(self, table_name, start_key, end_key, limit,
+                   do_async = False, timeout = None):
+        return self._run(self._dispatch('_read_range', table_name,
+                                        start_key, end_key, limit, timeout),
+                         do_async)
+
+    def read_range_n(self, table_name, start_key, n, do_async = False,
+                     timeout = None):
+        return self._run(self._dispatch('_read_range_n', table_name,
+                                        start_key, n, timeout), do_async)
+
+    def read_range_n_ts(self, table_name, start_key, n, do_async = False,
+                        timeout = None):
+        return self._run(self._dispatch('_read_range_n_ts', table_name,
+                                        start_key, n, timeout), do_async)
+
+    def first(self, table_name, do_async = False, timeout = None):
+        return self._run(self._open_iterator('_first', table_name, timeout),
+                         do_async)
+
+    def last(self, table_name, do_async = False, timeout = None):
+        return self._run(self._open_iterator('_last', table_name, timeout),
+                         do_async)
+
+    def seek(self, table_name, key, do_async = False, timeout = None):
+        return self._run(self._open_iterator('_seek', table_name, key,
+                                             timeout), do_async)
+
+    def next(self, it, do_async = False, timeout = None):
+        return self._run(self._iterate('_next', it, timeout), do_async)
+
+    def prev(self, it, do_async = False, timeout = None):
+        return self._run(self._iterate('_prev', it, timeout), do_async)
+
+    def add_index(self, table_name, config, do_async = False, timeout = None):
+        return self._run(self._dispatch('_add_index', table_name, config,
+                                        timeout), do_async)
+
+    def remove_index(self, table_name, columns, do_async = False,
+                     timeout = None):
+        return self._run(self._dispatch('_remove_index', table_name,
+                                        columns, timeout), do_async)
+
+    def list_tables(self, do_async = False, timeout = None):
+        return self._run(self._dispatch('_list_tables', timeout), do_async)
+
+    def _call_prepared(self, operation, args, do_async = False,
+                       timeout = None):
+        return self._run(self._dispatch('_execute', operation, args,
+                                        timeout), do_async)
+
+    def _run(self, coro, do_async):
+        if do_async:
+            return asyncio.run_coroutine_threadsafe(coro, self.loop)
+        else:
+            return self.loop.run_until_complete(coro)
+
+    def _pick(self, exclude = None):
+        endpoints = [e for e in self.endpoints if not e.ejected]
+        if not endpoints:
+            # Every node is ejected, keep trying all of them.
+            endpoints = self.endpoints
+        if exclude is not None:
+            others = [e for e in endpoints
+                      if e is not self.endpoint_of[exclude]]
+            if others:
+                endpoints = others
+        best = None
+        for endpoint in endpoints:
+            for client in endpoint.clients:
+                if client is exclude:
+                    continue
+                score = endpoint.latency * (len(client.message_dict) + 1)
+                if client.connected is not None:
+                    # Reconnecting, requests would wait for the connection.
+                    score = float('inf')
+                if best is None or score < best_score:
+                    (best, best_score) = (client, score)
+        return best
+
+    async def _call(self, client, procedure, *args):
+        """Call a procedure of client and record the node's health."""
+        endpoint = self.endpoint_of[client]
+        start = self.loop.time()
+        try:
+            res = await getattr(client, procedure)(*args)
+        except asyncio.CancelledError:
+            # A hedged request that lost, its latency is at least this.
+            endpoint.observe(self.loop.time() - start, self.latency_alpha)
+            raise
+        if isinstance(res, tuple) and res[0] == 'transport':
+            # Timed out or lost the connection.
+            self._eject(endpoint, res)
+        else:
+            endpoint.observe(self.loop.time() - start, self.latency_alpha)
+        return res
+
+    def _eject(self, endpoint, error):
+        if endpoint.ejected:
+            return
+        logging.warning('Ejecting %s:%s after %s', endpoint.host,
+                        endpoint.port, error)
+        endpoint.ejected = True
+        endpoint.probe = self.loop.create_task(self._probe(endpoint))
+
+    async def _probe(self, endpoint):
+        client = endpoint.clients[0]
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            start = self.loop.time()
+            res = await client._list_tables(self.probe_timeout)
+            if not isinstance(res, tuple):
+                break
+        logging.info('Node %s:%s is back', endpoint.host, endpoint.port)
+        endpoint.latency = self.loop.time() - start
+        endpoint.ejected = False
+        endpoint.probe = None
+
+    async def _dispatch(self, procedure, *args):
+        if (self.hedge_percentile is None or len(self.clients) < 2 or
+                procedure not in HEDGED_PROCEDURES):
+            return await self._call(self._pick(), procedure, *args)
+        return await self._hedge(procedure, *args)
+
+    async def _hedge(self, procedure, *args):
+        hedge_delay = self.hedge_delays.get(procedure)
+        if hedge_delay is None:
+            hedge_delay = HedgeDelay(self.hedge_percentile, self.hedge_window,
+                                     self.hedge_max_rate)
+            self.hedge_delays[procedure] = hedge_delay
+        hedge_delay.requests += 1
+        start = self.loop.time()
+        client = self._pick()
+        if hedge_delay.delay is None:
+            res = await self._call(client, procedure, *args)
+            hedge_delay.record(self.loop.time() - start)
+            return res
+        first = self.loop.create_task(self._call(client, procedure, *args))
+        # The latency of the first send, when it answers or is cancelled
+        # because the hedge won, in which case it is a lower bound.
+        first.add_done_callback(
+                lambda _: hedge_delay.record(self.loop.time() - start))
+        pending = [first]
+        try:
+            (done, _) = await asyncio.wait(pending, timeout=hedge_delay.delay)
+            if not done and hedge_delay.allow_hedge():
+                second = self._call(self._pick(client), procedure, *args)
+                pending.append(self.loop.create_task(second))
+            while True:
+                (done, pending) = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED)
+                results = [task.result() for task in done]
+                # Prefer a response over a timeout or a lost connection.
+                answers = [r for r in results
+                           if not (isinstance(r, tuple) and
+                                   r[0] == 'transport')]
+                res = (answers or results)[0]
+                if answers or not pending:
+                    break
+        finally:
+            # The late response of a cancelled request finds no waiting
+            # future in the client and is dropped.
+            for task in pending:
+                task.cancel()
+        return res
+
+    async def _open_iterator(self, procedure, *args):
+        client = self._pick()
+        res = await self._call(client, procedure, *args)
+        if isinstance(res, dict):
+            self.iterators[res['it']] = client
+        elif not isinstance(res, tuple):
+            # A response of the raw option.
+            rpdu = res
+            if isinstance(rpdu, bytes):
+                rpdu = apollo.ApolloPdu.FromString(rpdu)
+            self.iterators[rpdu.response.kcp_it.it] = client
+        return res
+
+    async def _iterate(self, procedure, it, timeout):
+        client = self.iterators.get(it)
+        if client is None:
+            client = self._pick()
+        res = await self._call(client, procedure, it, timeout)
+        if isinstance(res, tuple) and isinstance(res[0], str):
+            # An error tuple, the iterator is not usable anymore.
+            self.iterators.pop(it, None)
+        return res
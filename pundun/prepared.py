@@ -0,0 +1,81 @@
+# vim: set expandtab:
+from pundun import apollo_pb2 as apollo
+from pundun.schema import FieldsEncoder
+
+def _varint(n):
+    """Return the protobuf varint encoding of a non-negative integer."""
+    out = bytearray()
+    while n > 0x7f:
+        out.append(0x80 | (n & 0x7f))
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+class PreparedOperation:
+    """Request of one procedure on one table, partly serialized in advance.
+
+    The version, the procedure's tag and the table name of the pdu are
+    serialized once. A call encodes only the transaction id and its own
+    key and columns, and joins them with the cached bytes into the same
+    pdu bytes as the procedure would send.
+    """
+
+    procedure = None
+    message = None
+
+    def __init__(self, client, table_name, schema = None):
+        self.client = client
+        self.table_name = table_name
+        pdu = apollo.ApolloPdu()
+        pdu.version.major = 0
+        pdu.version.minor = 1
+        self.prefix = pdu.SerializeToString()
+        number = apollo.ApolloPdu.DESCRIPTOR.fields_by_name[
+                self.procedure].number
+        # Length delimited field of the procedure.
+        self.tag = _varint(number << 3 | 2)
+        self.table_bytes = self.message(
+                table_name=table_name).SerializeToString()
+        if schema is None:
+            (self.key, self.columns) = (FieldsEncoder({}), FieldsEncoder({}))
+        else:
+            (self.key, self.columns) = (schema.key, schema.columns)
+
+    def __call__(self, *args, **kwargs):
+        return self.client._call_prepared(self, args, **kwargs)
+
+    def encode(self, tid, *args):
+        """Return the serialized pdu of a call with transaction id tid."""
+        body = self.table_bytes + self.encode_body(*args)
+        parts = [self.prefix]
+        if tid:
+            # Field 2, transaction_id, is left out when 0.
+            parts.append(b'\x10' + _varint(tid))
+        parts.extend([self.tag, _varint(len(body)), body])
+        return b''.join(parts)
+
+    def encode_body(self, *args):
+        raise NotImplementedError
+
+class PreparedRead(PreparedOperation):
+    """Prepared read, called with a key."""
+
+    procedure = 'read'
+    message = apollo.Read
+
+    def encode_body(self, key):
+        message = apollo.Read()
+        self.key.encode(message.key, key)
+        return message.SerializeToString()
+
+class PreparedWrite(PreparedOperation):
+    """Prepared write, called with a key and columns."""
+
+    procedure = 'write'
+    message = apollo.Write
+
+    def encode_body(self, key, columns):
+        message = apollo.Write()
+        self.key.encode(message.key, key)
+        self.columns.encode(message.columns, columns)
+        return message.SerializeToString()
@@ -0,0 +1,101 @@
+# vim: set expandtab:
+import asyncio
+import collections
+import logging
+import struct
+
+from pundun import apollo_pb2 as apollo
+
+def _parses_memoryview():
+    # Old pure Python protobuf releases store slices of the input buffer
+    # in bytes fields instead of copying them.
+    field = apollo.Field()
+    field.value.binary = b'x'
+    parsed = apollo.Field()
+    try:
+        parsed.ParseFromString(memoryview(field.SerializeToString()))
+    except Exception:
+        return False
+    return type(parsed.value.binary) is bytes
+
+# True if payloads can be parsed straight from the receive buffer.
+ZERO_COPY_PARSE = _parses_memoryview()
+
+class PundunProtocol(asyncio.Protocol):
+    """Length prefixed framing of a pundun connection.
+
+    Received bytes are appended to one buffer and every complete frame is
+    passed to on_frame as a memoryview into that buffer, without the length
+    header. The view is only valid during the call. Consumed bytes are
+    dropped once all frames of a data_received call are handled.
+    """
+
+    def __init__(self, on_frame, on_lost):
+        self.on_frame = on_frame
+        self.on_lost = on_lost
+        self.transport = None
+        self.buffer = bytearray()
+        self.paused = False
+        self.drain_waiters = collections.deque()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        buf = self.buffer
+        buf += data
+        size = len(buf)
+        offset = 0
+        with memoryview(buf) as view:
+            while size - offset >= 4:
+                (length,) = struct.unpack_from('>I', buf, offset)
+                end = offset + 4 + length
+                if end > size:
+                    break
+                with view[offset + 4:end] as frame:
+                    try:
+                        self.on_frame(frame)
+                    except Exception:
+                        logging.exception('Failed to handle frame')
+                offset = end
+        try:
+            if offset == size:
+                buf.clear()
+            elif offset:
+                del buf[:offset]
+        except BufferError:
+            # A handler kept a view of a frame, leave the buffer to it.
+            self.buffer = buf[offset:]
+
+    def connection_lost(self, exc):
+        logging.info('Connection lost: %s', exc)
+        self.transport = None
+        self.paused = False
+        self._wake_drain_waiters(exc or ConnectionResetError('Connection lost'))
+        self.on_lost(exc)
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self._wake_drain_waiters(None)
+
+    def drain(self):
+        """Return a future resolved when writing resumes, None if not paused."""
+        if self.transport is None:
+            raise ConnectionResetError('Connection lost')
+        if not self.paused:
+            return None
+        waiter = asyncio.get_event_loop().create_future()
+        self.drain_waiters.append(waiter)
+        return waiter
+
+    def _wake_drain_waiters(self, exc):
+        while self.drain_waiters:
+            waiter = self.drain_waiters.popleft()
+            if not waiter.done():
+                if exc is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(exc)
@@ -0,0 +1,57 @@
+# vim: set expandtab:
+from pundun import apollo_pb2 as apollo
+from pundun import utils
+
+# Value fields of the Python types an encoder can be compiled for.
+VALUE_FIELDS = {bool: 'boolean',
+                int: 'int',
+                bytes: 'binary',
+                float: 'double',
+                str: 'string'}
+
+class FieldsEncoder:
+    """Encoder of a dictionary of fields with known value types.
+
+    types maps field names to bool, int, bytes, float or str. Fields with
+    other types, like list or dict, or fields not in types are encoded as
+    by utils.make_fields. Fields are added straight to a repeated Field of
+    a message, in the order of the dictionary.
+    """
+
+    def __init__(self, types):
+        self.value_fields = {}
+        for (name, value_type) in types.items():
+            value_field = VALUE_FIELDS.get(value_type)
+            if value_field is not None:
+                self.value_fields[name] = value_field
+
+    def encode(self, repeated, dictionary):
+        value_fields = self.value_fields
+        add = repeated.add
+        for (name, value) in dictionary.items():
+            field = add()
+            field.name = name
+            value_field = value_fields.get(name)
+            if value_field is None or value is None:
+                utils.set_value(field.value, value)
+            else:
+                setattr(field.value, value_field, value)
+
+class TableSchema:
+    """Compiled encoders of the keys and columns of a table."""
+
+    def __init__(self, table_name, key_types, column_types = {}):
+        self.table_name = table_name
+        self.key = FieldsEncoder(key_types)
+        self.columns = FieldsEncoder(column_types)
+
+    def make_key_columns_pair(self, key, columns):
+        kcp = apollo.KeyColumnsPair()
+        self.key.encode(kcp.key, key)
+        self.columns.encode(kcp.columns, columns)
+        return kcp
+
+    def make_key(self, key):
+        fields = apollo.KeyColumnsPair().key
+        self.key.encode(fields, key)
+        return list(fields)
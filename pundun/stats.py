@@ -0,0 +1,124 @@
+# vim: set expandtab:
+import collections
+
+class Histogram:
+    """Latency histogram with a bounded relative error, in the HDR style.
+
+    Values are counted in microseconds. Values below 2 ** (precision + 1)
+    have a bucket each, every larger power of two is split into
+    2 ** precision buckets. The default precision of 5 keeps the error of
+    a reported value below 3 percent. Recording is a few integer
+    operations and one list update.
+    """
+
+    def __init__(self, precision = 5, max_value = 2 ** 40):
+        self.precision = precision
+        self.counts = [0] * (self._index(max_value) + 1)
+        self.max_index = len(self.counts) - 1
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        shift = value.bit_length() - self.precision - 1
+        if shift <= 0:
+            return value
+        return (shift << self.precision) + (value >> shift)
+
+    def _value(self, index):
+        """Highest value counted in the bucket at index."""
+        shift = (index >> self.precision) - 1
+        if shift <= 0:
+            return index
+        low = index - (shift << self.precision)
+        return ((low + 1) << shift) - 1
+
+    def record(self, value):
+        index = self._index(value)
+        if index > self.max_index:
+            index = self.max_index
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def merge(self, other):
+        for (index, count) in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min,
+                                                              other.min)
+
+    def percentile(self, q):
+        """Return the value below which q percent of the values fall."""
+        if not self.count:
+            return 0
+        rank = max(1, int(self.count * q / 100.0 + 0.5))
+        seen = 0
+        for (index, count) in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """Return count, mean and percentiles, converted to seconds."""
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count,
+                'min': self.min / 1e6,
+                'mean': self.total / self.count / 1e6,
+                'p50': self.percentile(50) / 1e6,
+                'p90': self.percentile(90) / 1e6,
+                'p99': self.percentile(99) / 1e6,
+                'p999': self.percentile(99.9) / 1e6,
+                'max': self.max / 1e6}
+
+class Stats:
+    """Request counters and latency histograms of a connection."""
+
+    def __init__(self):
+        self.latency = {}
+        self.requests = collections.Counter()
+        self.errors = collections.Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def record(self, procedure, seconds, rpdu):
+        histogram = self.latency.get(procedure)
+        if histogram is None:
+            histogram = self.latency[procedure] = Histogram()
+        histogram.record(int(seconds * 1e6))
+        self.requests[procedure] += 1
+        # An encoded pdu of the raw option is never an error.
+        if type(rpdu) is not bytes and rpdu.HasField('error'):
+            # The category of utils.format_error, such as 'transport'.
+            self.errors[rpdu.error.WhichOneof('cause')] += 1
+
+    def merge(self, other):
+        for (procedure, histogram) in other.latency.items():
+            if procedure not in self.latency:
+                self.latency[procedure] = Histogram()
+            self.latency[procedure].merge(histogram)
+        self.requests.update(other.requests)
+        self.errors.update(other.errors)
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+
+    def snapshot(self, in_flight):
+        return {'requests': dict(self.requests),
+                'errors': dict(self.errors),
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'in_flight': in_flight,
+                'latency': dict((procedure, histogram.summary())
+                                for (procedure, histogram)
+                                in self.latency.items())}
@@ -0,0 +1,75 @@
+# vim: set expandtab:
+import asyncio
+
+class TimerWheel:
+    """Hashed timer wheel expiring futures of pending requests.
+
+    A single loop callback ticks every resolution seconds while there are
+    scheduled futures, instead of one timer per request. Ticks follow the
+    loop's clock: a late callback expires every slot it missed, so a busy
+    loop does not stretch deadlines. A future that is still pending when
+    its tick comes gets asyncio.TimeoutError set. Answered requests remove
+    their future with the slot returned by schedule, so the wheel only
+    holds pending requests.
+    """
+
+    def __init__(self, loop, resolution = 0.1, slots = 512):
+        self.loop = loop
+        self.resolution = resolution
+        self.slots = [{} for _ in range(slots)]
+        self.origin = loop.time()
+        # Last tick whose slot was expired.
+        self.tick = 0
+        self.count = 0
+        self.handle = None
+
+    def _now(self):
+        # Tick of the loop's clock, the small offset absorbs float error.
+        return int((self.loop.time() - self.origin) / self.resolution + 1e-9)
+
+    def schedule(self, timeout, fut):
+        now = self._now()
+        if self.handle is None:
+            # Idle, there are no missed slots to expire.
+            self.tick = now
+        ticks = max(1, int(timeout / self.resolution + 0.999999))
+        expiry = now + ticks
+        slot = expiry % len(self.slots)
+        self.slots[slot][fut] = expiry
+        self.count += 1
+        if self.handle is None:
+            self._call_at(self.tick + 1)
+        return slot
+
+    def remove(self, slot, fut):
+        if self.slots[slot].pop(fut, None) is not None:
+            self.count -= 1
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def _call_at(self, tick):
+        self.handle = self.loop.call_at(
+                self.origin + tick * self.resolution, self._tick)
+
+    def _tick(self):
+        now = self._now()
+        size = len(self.slots)
+        # Every slot once, even if the callback is more than a turn late.
+        for tick in range(max(self.tick + 1, now - size + 1), now + 1):
+            slot = self.slots[tick % size]
+            if slot:
+                expired = [f for (f, expiry) in slot.items()
+                           if expiry <= now]
+                for fut in expired:
+                    del slot[fut]
+                    self.count -= 1
+                    if not fut.done():
+                        fut.set_exception(asyncio.TimeoutError())
+        self.tick = max(self.tick, now)
+        if self.count > 0:
+            self._call_at(self.tick + 1)
+        else:
+            self.handle = None
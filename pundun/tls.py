@@ -0,0 +1,47 @@
+# vim: set expandtab:
+import logging
+import ssl
+
+# PROTOCOL_TLS_CLIENT is not available before Python 3.6.
+_PROTOCOL = getattr(ssl, 'PROTOCOL_TLS_CLIENT', ssl.PROTOCOL_SSLv23)
+
+# Client contexts by (host, port), shared by all connections to a server.
+_contexts = {}
+
+class ResumingContext(ssl.SSLContext):
+    """Client context offering the last TLS session of its server.
+
+    asyncio does not pass a session when it wraps a connection, so the
+    context adds the session saved by save_session. The server decides
+    whether the session is resumed, otherwise a full handshake is made.
+    """
+
+    session = None
+
+    def wrap_bio(self, incoming, outgoing, server_side = False,
+                 server_hostname = None, session = None):
+        if session is None and not server_side:
+            session = self.session
+        return super().wrap_bio(incoming, outgoing, server_side,
+                                server_hostname, session)
+
+def client_context(host, port):
+    """Return the shared client context of a server, created on first use."""
+    key = (host, port)
+    ctx = _contexts.get(key)
+    if ctx is None:
+        ctx = ResumingContext(_PROTOCOL)
+        # Like the CLIENT_AUTH default context, certificates are not checked.
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        _contexts[key] = ctx
+    return ctx
+
+def save_session(ctx, transport):
+    """Keep the session of an established connection for the next one."""
+    ssl_object = transport.get_extra_info('ssl_object')
+    if ssl_object is None:
+        return
+    logging.debug('TLS session reused: %s', ssl_object.session_reused)
+    if ssl_object.session is not None:
+        ctx.session = ssl_object.session
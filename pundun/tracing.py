@@ -0,0 +1,31 @@
+# vim: set expandtab:
+import json
+import time
+
+# Clock of all trace timestamps, in seconds.
+clock = time.monotonic
+
+# Stages of a request in the order their timestamps are taken.
+STAGES = ('build', 'encode', 'encoded', 'queued', 'written', 'received',
+          'parsed', 'formatted')
+
+class JsonlTrace:
+    """Trace hook appending one JSON object per request to a file.
+
+    client.add_trace_hook(JsonlTrace('trace.jsonl'))
+
+    Every line holds the transaction id as tid, the procedure and the
+    timestamps of STAGES. Timestamps of stages a request did not reach,
+    like written for a request that timed out waiting for a cid, are
+    missing.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def __call__(self, trace):
+        self.file.write(json.dumps(trace))
+        self.file.write('\n')
+
+    def close(self):
+        self.file.close()
@@ -1,4 +1,6 @@
+import collections.abc
 import logging
+import operator
 import pprint
 from pundun import apollo_pb2 as apollo
 from pundun import constants as enum
@@ -10,6 +12,17 @@ def setup_logging(level = logging.WARNING):
             )
     logging.basicConfig(format=log_fmt, level=level, datefmt=date_fmt)
 
+class LazyFormat:
+    """Log argument running pprint.pformat only if the record is emitted."""
+
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return pprint.pformat(self.obj)
+
 def make_table_options(dictionary):
     return [_make_table_option(k, v) for k, v in dictionary.items()]
 
@@ -43,28 +56,16 @@ def make_fields(dictionary):
 def make_field(name, value):
     field = apollo.Field()
     field.name = name
-    if isinstance(value, bool):
-        field.value.boolean = value
-    elif isinstance(value, int):
-        field.value.int = value
-    elif isinstance(value, (bytes, bytearray)):
-        field.value.binary = value
-    elif value == None:
-        field.value.null = b''
-    elif isinstance(value, float):
-        field.value.double = value
-    elif isinstance(value, str):
-        field.value.string = value
-    elif isinstance(value, list):
-        values = [make_value(v) for v in value]
-        field.value.list.values.extend(values)
-    elif isinstance(value, dict):
-        for k, v in value.items():
-            field.value.map.values[k].CopyFrom(make_value(v))
+    set_value(field.value, value)
     return field
 
 def make_value(val):
     value = apollo.Value()
+    set_value(value, val)
+    return value
+
+def set_value(value, val):
+    """Store a Python value in the apollo.Value message value."""
     if isinstance(val, bool):
         value.boolean = val
     elif isinstance(val, int):
@@ -78,12 +79,68 @@ def make_value(val):
     elif isinstance(val, str):
         value.string = val
     elif isinstance(val, list):
-        values = [make_value(v) for v in val]
-        value.list.values.extend(values)
+        value.list.SetInParent()
+        for v in val:
+            set_value(value.list.values.add(), v)
     elif isinstance(val, dict):
         for k, v in val.items():
-            value.map.values[k].CopyFrom(make_value(v))
-    return value
+            set_value(value.map.values[k], v)
+
+def make_key_columns_pair(key, columns):
+    kcp = apollo.KeyColumnsPair()
+    kcp.key.extend(make_fields(key))
+    kcp.columns.extend(make_fields(columns))
+    return kcp
+
+def make_batches(writes, deletes, max_rows, max_bytes, schema = None):
+    """Split writes and deletes into (kcps, delete_keys) batches.
+
+    Each batch holds at most max_rows rows and roughly max_bytes of encoded
+    rows. A single row larger than max_bytes gets a batch of its own. Rows
+    are encoded by schema, a TableSchema, if given.
+    """
+    batches = []
+    kcps = []
+    delete_keys = []
+    rows = 0
+    size = 0
+    items = [(True, w) for w in writes] + [(False, d) for d in deletes]
+    for (is_write, row) in items:
+        if is_write:
+            (key, columns) = row
+            if schema is None:
+                item = make_key_columns_pair(key, columns)
+            else:
+                item = schema.make_key_columns_pair(key, columns)
+            # Tag and length prefix of the embedded message.
+            item_size = item.ByteSize() + 5
+        else:
+            if schema is None:
+                item = make_fields(row)
+            else:
+                item = schema.make_key(row)
+            item_size = sum([f.ByteSize() + 5 for f in item])
+        if rows > 0 and (rows >= max_rows or size + item_size > max_bytes):
+            batches.append((kcps, delete_keys))
+            kcps = []
+            delete_keys = []
+            rows = 0
+            size = 0
+        if is_write:
+            kcps.append(item)
+        else:
+            delete_keys.extend(item)
+        rows += 1
+        size += item_size
+    if rows > 0:
+        batches.append((kcps, delete_keys))
+    return batches
+
+def first_error(results):
+    for res in results:
+        if res is not True:
+            return res
+    return True
 
 def make_index_config_list(config):
     return [make_index_config(c) for c in config]
@@ -135,74 +192,103 @@ def uIntToBinaryDefault(uint):
     else:
         return b''
 
-def format_rpdu(pdu):
-    logging.debug('response pdu: %s',pprint.pformat(pdu))
-    if pdu.HasField('response'):
-        return format_response(pdu.response)
-    elif pdu.HasField('error'):
+def format_rpdu(pdu, lazy = False):
+    kind = pdu.WhichOneof('procedure')
+    if kind == 'response':
+        return format_response(pdu.response, lazy)
+    elif kind == 'error':
         return format_error(pdu.error)
 
-def format_response(response):
-        if response.HasField('ok'):
-            return True
-        elif response.HasField('columns'):
-            return format_fields(response.columns.fields)
-        elif response.HasField('key_columns_pair'):
-            return format_kcp(response.key_columns_pair)
-        elif response.HasField('key_columns_list'):
-            return format_kcl(response.key_columns_list)
-        elif response.HasField('proplist'):
-            return format_fields(response.proplist.fields)
-        elif response.HasField('kcp_it'):
-            return format_kcp_it(response.kcp_it)
-        elif response.HasField('postings'):
-            return format_postings(response.postings)
-        elif response.HasField('string_list'):
-            return response.string_list.field_names
+def format_response(response, lazy = False):
+    """Format a response, with FieldsView rows if lazy is True."""
+    kind = response.WhichOneof('result')
+    if kind is not None:
+        row_format = FieldsView if lazy else format_fields
+        return _RESPONSE_FORMATS[kind](response, row_format)
 
 def format_error(error):
-    if error.HasField('system'):
-        return ('system', error.system)
-    elif error.HasField('protocol'):
-        return ('protocol', error.protocol)
-    elif error.HasField('transport'):
-        return ('transport', error.transport)
-    elif error.HasField('misc'):
-        return ('misc', error.misc)
+    kind = error.WhichOneof('cause')
+    if kind is not None:
+        return (kind, getattr(error, kind))
 
 def format_fields(fields):
-    return dict([format_field(f) for f in fields])
+    formats = _VALUE_FORMATS
+    dictionary = {}
+    # A slice is a plain list, iterating it is cheaper than the container.
+    for field in fields[:]:
+        value = field.value
+        dictionary[field.name] = formats[value.WhichOneof('type')](value)
+    return dictionary
+
+class FieldsView(collections.abc.Mapping):
+    """Read-only mapping over the Fields of a response.
+
+    A value is formatted on its first lookup and then cached, so a row of
+    which only some columns are read costs only those. The view keeps the
+    response pdu alive. It compares equal to the dict of format_fields
+    and is pickled as that dict.
+    """
+
+    __slots__ = ('_fields', '_index', '_cache')
+
+    def __init__(self, fields):
+        self._fields = fields
+        # Field messages by name, built on first use.
+        self._index = None
+        self._cache = {}
+
+    def _fields_by_name(self):
+        if self._index is None:
+            self._index = {field.name: field for field in self._fields[:]}
+        return self._index
+
+    def __getitem__(self, name):
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        value = format_value(self._fields_by_name()[name].value)
+        self._cache[name] = value
+        return value
+
+    def __iter__(self):
+        return iter(self._fields_by_name())
+
+    def __len__(self):
+        return len(self._fields_by_name())
+
+    def __contains__(self, name):
+        return name in self._fields_by_name()
+
+    def __repr__(self):
+        return 'FieldsView(%r)' % (dict(self),)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
 
 def format_field(field):
-    name = field.name
-    value = format_value(field.value)
-    return (name, value)
+    return (field.name, format_value(field.value))
 
 def format_value(val):
-    value = None
-    if val.HasField('boolean'):
-        value = val.boolean
-    elif val.HasField('int'):
-        value = val.int
-    elif val.HasField('binary'):
-        value = val.binary
-    elif val.HasField('null'):
-        value == None
-    elif val.HasField('double'):
-        value = val.double
-    elif val.HasField('string'):
-        value = val.string
-    elif val.HasField('list'):
-        value = [format_value(v) for v in val.list.values]
-    elif val.HasField('map'):
-        value = {k: format_value(v) for k, v in val.map.values.items()}
-    return value
+    return _VALUE_FORMATS[val.WhichOneof('type')](val)
+
+def _format_null(val):
+    return None
+
+def _format_list(val):
+    formats = _VALUE_FORMATS
+    return [formats[v.WhichOneof('type')](v) for v in val.list.values[:]]
 
-def format_kcp(kcp):
-    return (format_fields(kcp.key), format_fields(kcp.columns))
+def _format_map(val):
+    formats = _VALUE_FORMATS
+    return {k: formats[v.WhichOneof('type')](v)
+            for (k, v) in val.map.values.items()}
 
-def format_kcp_it(kcp_it):
-    return {'kcp': format_kcp(kcp_it.key_columns_pair),
+def format_kcp(kcp, row_format = format_fields):
+    return (row_format(kcp.key), row_format(kcp.columns))
+
+def format_kcp_it(kcp_it, row_format = format_fields):
+    return {'kcp': format_kcp(kcp_it.key_columns_pair, row_format),
             'it': kcp_it.it}
 
 def format_continuation(cont):
@@ -211,8 +297,10 @@ def format_continuation(cont):
     else:
         return format_fields(cont.key)
 
-def format_kcl(key_columns_list):
-    kcl = [format_kcp(kcp) for kcp in key_columns_list.list]
+def format_kcl(key_columns_list, row_format = format_fields):
+    # Rows are formatted in one loop, a range read can return many.
+    kcl = [(row_format(kcp.key), row_format(kcp.columns))
+           for kcp in key_columns_list.list[:]]
     cont = format_continuation(key_columns_list.continuation)
     return {'key_columns_list': kcl, 'continuation': cont}
 
@@ -224,3 +312,29 @@ def format_posting(posting):
             'timestamp': posting.timestamp,
             'frequency': posting.frequency,
             'position': posting.position}
+
+# Formatters of the value of every Value type, and of an unset Value.
+_VALUE_FORMATS = {None: _format_null,
+                  'boolean': operator.attrgetter('boolean'),
+                  'int': operator.attrgetter('int'),
+                  'binary': operator.attrgetter('binary'),
+                  'null': _format_null,
+                  'double': operator.attrgetter('double'),
+                  'string': operator.attrgetter('string'),
+                  'list': _format_list,
+                  'map': _format_map}
+
+# Formatters of every result of a Response, called with the response and
+# the formatter of the rows' keys and columns.
+_RESPONSE_FORMATS = {
+    'ok': lambda r, row_format: True,
+    'columns': lambda r, row_format: row_format(r.columns.fields),
+    'key_columns_pair':
+        lambda r, row_format: format_kcp(r.key_columns_pair, row_format),
+    'key_columns_list':
+        lambda r, row_format: format_kcl(r.key_columns_list, row_format),
+    'proplist': lambda r, row_format: format_fields(r.proplist.fields),
+    'kcp_it': lambda r, row_format: format_kcp_it(r.kcp_it, row_format),
+    'postings': lambda r, row_format: format_postings(r.postings),
+    'string_list':
+        lambda r, row_format: list(r.string_list.field_names)}
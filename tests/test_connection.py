@@ -4,10 +4,18 @@ import asyncio
 import logging
 from context import pundun
 from pundun import Client
+from pundun import ClientPool
+from pundun import AsyncClient
+import pickle
+import struct
 import unittest
 import pprint
 from pundun import utils
+from pundun import apollo
 from pundun import constants as enum
+from pundun import tracing
+from pundun.parallel import ParallelExecutor
+from pundun.timer import TimerWheel
 from threading import Timer
 import concurrent.futures
 import time
@@ -235,6 +243,577 @@ class TestPundunConnection(unittest.TestCase):
         self.assertEqual(read_range_res['key_columns_list'], expected_range_res)
         client.cleanup()
 
+    #@unittest.skip('skip test_batch_write')
+    def test_batch_write(self):
+        host = '127.0.0.1'
+        port = 8887
+        user = 'admin'
+        secret = 'admin'
+        logging.info("testing batch write..")
+        client = Client(host, port, user, secret, batch_max_rows=10)
+        table_name = 'pundunpy_batch_table'
+        tab_exists = table_name in client.list_tables()
+        if tab_exists:
+            self.assertTrue(client.delete_table(table_name))
+        self.assertTrue(client.create_table(table_name,
+                                            ['id'],
+                                            {'num_of_shards': 1}))
+        writes = [({'id': i}, {'text': 'Row ' + str(i)}) for i in range(25)]
+        self.assertTrue(client.batch_write(table_name, writes))
+        self.assertEqual(client.read(table_name, {'id': 24}),
+                         {'text': 'Row 24'})
+        deletes = [{'id': i} for i in range(20)]
+        self.assertTrue(client.batch_write(table_name, [], deletes))
+        self.assertEqual(client.read(table_name, {'id': 0}),
+                         ('misc', '{error,not_found}'))
+        self.assertEqual(client.read(table_name, {'id': 20}),
+                         {'text': 'Row 20'})
+        client.cleanup()
+
+    #@unittest.skip('skip test_pool')
+    def test_pool(self):
+        logging.info("testing client pool..")
+        pool = ClientPool('127.0.0.1', 8887, 'admin', 'admin', size=3)
+        table_name = 'pundunpy_pool_table'
+        if table_name in pool.list_tables():
+            self.assertTrue(pool.delete_table(table_name))
+        self.assertTrue(pool.create_table(table_name,
+                                          ['id'],
+                                          {'num_of_shards': 1}))
+        key1 = {'id': '0001'}
+        key2 = {'id': '0002'}
+        data1 = {'text': 'One'}
+        data2 = {'text': 'Two'}
+        self.assertTrue(pool.write(table_name, key1, data1))
+        self.assertTrue(pool.write(table_name, key2, data2))
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            executor.submit(pool.run_loop)
+            futures = [pool.read(table_name, key1, do_async=True)
+                       for i in range(30)]
+            for future in futures:
+                self.assertEqual(future.result(3), data1)
+            executor.submit(pool.stop_loop)
+        kcp_it = pool.first(table_name)
+        self.assertEqual(kcp_it['kcp'], (key1, data1))
+        self.assertEqual(pool.next(kcp_it['it']), (key2, data2))
+        pool.cleanup()
+
+    #@unittest.skip('skip test_async_client')
+    def test_async_client(self):
+        logging.info("testing async client..")
+        asyncio.run(self._async_client_calls())
+
+    async def _async_client_calls(self):
+        table_name = 'pundunpy_async_table'
+        async with AsyncClient('127.0.0.1', 8887, 'admin', 'admin') as client:
+            if table_name in await client.list_tables():
+                self.assertTrue(await client.delete_table(table_name))
+            self.assertTrue(await client.create_table(table_name,
+                                                      ['id'],
+                                                      {'num_of_shards': 1}))
+            keys = [{'id': str(i)} for i in range(10)]
+            data = [{'text': 'Row ' + str(i)} for i in range(10)]
+            writes = [client.write(table_name, k, d)
+                      for (k, d) in zip(keys, data)]
+            self.assertTrue(all(await asyncio.gather(*writes)))
+            reads = [client.read(table_name, k) for k in keys]
+            self.assertEqual(await asyncio.gather(*reads), data)
+
+    #@unittest.skip('skip test_pipeline')
+    def test_pipeline(self):
+        logging.info("testing pipeline..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin')
+        table_name = 'pundunpy_pipeline_table'
+        if table_name in client.list_tables():
+            self.assertTrue(client.delete_table(table_name))
+        self.assertTrue(client.create_table(table_name,
+                                            ['id'],
+                                            {'num_of_shards': 1}))
+        keys = [{'id': str(i)} for i in range(10)]
+        data = [{'text': 'Row ' + str(i)} for i in range(10)]
+        with client.pipeline() as p:
+            for (k, d) in zip(keys, data):
+                p.write(table_name, k, d)
+        self.assertEqual(p.results, [True] * 10)
+        with client.pipeline() as p:
+            for k in keys:
+                p.read(table_name, k)
+            missing = p.read(table_name, {'id': 'missing'})
+        self.assertEqual(p.results[:10], data)
+        self.assertEqual(p.results[missing], ('misc', '{error,not_found}'))
+        client.cleanup()
+
+    def test_in_flight_window(self):
+        logging.info("testing the in flight window..")
+        (queued, acquired, written) = ([], [], [])
+
+        class Table(dict):
+            peak = 0
+            def __setitem__(self, cid, value):
+                # A cid belongs to one request at a time.
+                assert cid not in self, cid
+                super().__setitem__(cid, value)
+                Table.peak = max(Table.peak, len(self))
+
+        class WindowClient(Client):
+            async def _acquire_cid(self, deadline):
+                if not self.free_cids:
+                    queued.append(deadline)
+                cid = await super()._acquire_cid(deadline)
+                acquired.append(deadline)
+                return cid
+
+        client = WindowClient('127.0.0.1', 8887, 'admin', 'admin',
+                              max_in_flight = 2, timeout = 5)
+        table_name = 'pundunpy_window_table'
+        if table_name not in client.list_tables():
+            self.assertTrue(client.create_table(table_name, ['id'],
+                                                {'num_of_shards': 1}))
+        data = [{'text': 'Row ' + str(i)} for i in range(8)]
+        for (i, d) in enumerate(data):
+            self.assertTrue(client.write(table_name, {'id': i}, d))
+        client.message_dict = Table()
+        del acquired[:]
+        writelines = client.transport.writelines
+        def count(parts):
+            written.append(len(parts) // 2)
+            writelines(parts)
+        client.transport.writelines = count
+        def delay(frame):
+            # Hold the responses so that the window stays full.
+            client.loop.call_later(0.05, client._dispatch,
+                                   memoryview(bytes(frame)))
+        client.protocol.on_frame = delay
+
+        async def burst():
+            loop = client.loop
+            reads = [loop.create_task(client._read(table_name, {'id': i}))
+                     for i in range(8)]
+            # Expires while queued for a cid.
+            late = loop.create_task(client._read(table_name, {'id': 0},
+                                                 timeout = 0.02))
+            return (await asyncio.gather(*reads), await late)
+
+        (reads, late) = client.loop.run_until_complete(burst())
+        self.assertEqual(reads, data)
+        self.assertEqual(late, ('transport', 'timeout'))
+        self.assertEqual(Table.peak, 2)
+        # Released cids went to the waiters in the order they queued.
+        self.assertEqual(len(queued), 7)
+        expired = [d for d in queued if d not in acquired]
+        self.assertEqual(expired, [queued[-1]])
+        self.assertEqual(acquired[2:], queued[:-1])
+        self.assertEqual(len(client.free_cids), 2)
+        self.assertEqual(client.message_dict, {})
+        # Frames of one loop iteration go out with one writelines call.
+        self.assertEqual(written[0], 2)
+
+        async def drain():
+            del written[:]
+            loop = client.loop
+            client.write_buffer_high = -1
+            client.protocol.pause_writing()
+            reads = [loop.create_task(client._read(table_name, {'id': i}))
+                     for i in range(2)]
+            await asyncio.sleep(0.01)
+            # Written, the requests wait for the transport to drain.
+            self.assertEqual(written, [2])
+            self.assertEqual(len(client.protocol.drain_waiters), 2)
+            client.protocol.resume_writing()
+            self.assertEqual(await asyncio.gather(*reads), data[:2])
+            client.protocol.on_frame = client._dispatch
+            client.protocol.pause_writing()
+            # Still paused, a response ends the wait of its request.
+            reads = [loop.create_task(client._read(table_name, {'id': i}))
+                     for i in range(2)]
+            return await asyncio.gather(*reads)
+
+        self.assertEqual(client.loop.run_until_complete(drain()), data[:2])
+        client.cleanup()
+
+    def test_reconnect(self):
+        logging.info("testing reconnect..")
+        written = []
+
+        class CountingClient(Client):
+            async def _establish(self):
+                await super()._establish()
+                # Frames written on the latest connection.
+                del written[:]
+                writelines = self.transport.writelines
+                def count(parts):
+                    # Frames are header, payload pairs.
+                    written.extend(parts[1::2])
+                    writelines(parts)
+                self.transport.writelines = count
+
+        client = CountingClient('127.0.0.1', 8887, 'admin', 'admin',
+                                reconnect_delay = 0.01, timeout = 5)
+        table_name = 'pundunpy_reconnect_table'
+        if table_name not in client.list_tables():
+            self.assertTrue(client.create_table(table_name, ['id'],
+                                                {'num_of_shards': 1}))
+        data = {'count': 1}
+        self.assertTrue(client.write(table_name, {'id': 1}, data))
+
+        async def drop():
+            loop = client.loop
+            reads = [loop.create_task(client._read(table_name, {'id': 1}))
+                     for _ in range(3)]
+            update = loop.create_task(
+                    client._update(table_name, {'id': 1},
+                                   [{'field': 'count', 'value': 2}]))
+            await asyncio.sleep(0)
+            client.transport.abort()
+            await asyncio.sleep(0.001)
+            # Sent while reconnecting.
+            reads += [loop.create_task(client._read(table_name, {'id': 1}))
+                      for _ in range(2)]
+            return (await asyncio.gather(*reads), await update)
+
+        (reads, update) = client.loop.run_until_complete(drop())
+        self.assertEqual(update, ('transport', 'connection_lost'))
+        self.assertEqual(len(reads), 5)
+        for res in reads:
+            self.assertIsInstance(res, dict)
+        # Three replayed and two new reads, each written once.
+        self.assertEqual(len(written), 5)
+        self.assertEqual(len(set(written)), 5)
+        self.assertEqual(client.replayable, {})
+        self.assertEqual(len(client.free_cids), 65536)
+        client.cleanup()
+
+        class FlakyClient(Client):
+            abort_auth = False
+            async def _auth(self):
+                if self.abort_auth:
+                    # Lose the connection of this attempt during auth.
+                    self.abort_auth = False
+                    self.transport.abort()
+                await super()._auth()
+
+        client = FlakyClient('127.0.0.1', 8887, 'admin', 'admin',
+                             reconnect_delay = 0.01, timeout = 5)
+
+        async def drop_twice():
+            client.abort_auth = True
+            client.transport.abort()
+            await asyncio.sleep(0.001)
+            # Sent while the first reconnect attempt fails.
+            return await asyncio.gather(
+                    client._read(table_name, {'id': 1}),
+                    client._write(table_name, {'id': 2}, data))
+
+        self.assertEqual(client.loop.run_until_complete(drop_twice()),
+                         [data, True])
+        self.assertFalse(client.abort_auth)
+        self.assertEqual(client.sent, set())
+        client.cleanup()
+
+        client = Client('127.0.0.1', 8887, 'admin', 'admin',
+                        reconnect = False)
+        client.transport.abort()
+        client.loop.run_until_complete(asyncio.sleep(0.001))
+        self.assertEqual(client.read(table_name, {'id': 1}),
+                         ('transport', 'connection_lost'))
+        self.assertEqual(client.list_tables(),
+                         ('transport', 'connection_lost'))
+        client.cleanup()
+
+    def test_timeout(self):
+        logging.info("testing timeout..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin', timeout = 5)
+        table_name = 'pundunpy_timeout_table'
+        if table_name not in client.list_tables(timeout = 1):
+            self.assertTrue(client.create_table(table_name,
+                                                ['id'],
+                                                {'num_of_shards': 1},
+                                                timeout = 10))
+        self.assertIn(table_name, client.list_tables(timeout = 1))
+        self.assertEqual(client.read(table_name, {'id': 'missing'},
+                                     timeout = 1),
+                         ('misc', '{error,not_found}'))
+        self.assertEqual(len(client.free_cids), 65536)
+        client.cleanup()
+
+    def test_bad_frame(self):
+        logging.info("testing a frame that fails to parse..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin')
+        pdu = apollo.ApolloPdu()
+        pdu.transaction_id = 1
+        pdu.response.columns.fields.extend(utils.make_fields({'a': 'b'}))
+        payload = pdu.SerializeToString()[:-1]
+        cid = client.free_cids.popleft()
+        fut = client.loop.create_future()
+        client.message_dict[cid] = (1, fut)
+        frame = struct.pack('>IH', len(payload) + 2, cid) + payload
+        client.protocol.data_received(frame)
+        self.assertIsInstance(fut.exception(), Exception)
+        self.assertIsNone(fut.exception().__traceback__)
+        # An error that cannot be built again from its args is kept.
+        class ParseError(Exception):
+            def __init__(self, reason, offset):
+                super().__init__('%s at %d' % (reason, offset))
+        def parse(payload):
+            raise ParseError('bad pdu', payload.nbytes)
+        client._parse = parse
+        fut = client.loop.create_future()
+        client.message_dict[cid] = (1, fut)
+        client.protocol.data_received(frame)
+        self.assertIsInstance(fut.exception(), ParseError)
+        self.assertIsNone(fut.exception().__traceback__)
+        del client._parse
+        del client.message_dict[cid]
+        client.free_cids.append(cid)
+        self.assertEqual(len(client.protocol.buffer), 0)
+        self.assertIsInstance(client.list_tables(), list)
+        client.cleanup()
+
+    def test_timer_wheel(self):
+        logging.info("testing timer wheel on a busy loop..")
+        loop = asyncio.new_event_loop()
+        wheel = TimerWheel(loop, resolution = 0.01, slots = 1024)
+        def busy():
+            # 20 ms of work in every loop iteration.
+            time.sleep(0.02)
+            handles.append(loop.call_soon(busy))
+        handles = [loop.call_soon(busy)]
+        async def expire(timeout):
+            fut = loop.create_future()
+            start = loop.time()
+            wheel.schedule(timeout, fut)
+            with self.assertRaises(asyncio.TimeoutError):
+                await fut
+            return loop.time() - start
+        elapsed = loop.run_until_complete(expire(0.1))
+        handles[-1].cancel()
+        loop.close()
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 0.2)
+
+    def test_stats(self):
+        logging.info("testing stats..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin')
+        tables = client.list_tables()
+        client.read(tables[0] if tables else 'pundunpy_no_table', {'id': 0})
+        stats = client.stats()
+        self.assertEqual(stats['requests']['list_tables'], 1)
+        self.assertEqual(stats['requests']['read'], 1)
+        self.assertEqual(stats['latency']['read']['count'], 1)
+        self.assertGreater(stats['bytes_sent'], 0)
+        self.assertGreater(stats['bytes_received'], 0)
+        self.assertEqual(stats['in_flight'], 0)
+        client.cleanup()
+
+    def test_trace_hook(self):
+        logging.info("testing trace hook..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin')
+        traces = []
+        client.add_trace_hook(traces.append)
+        client.list_tables()
+        client.remove_trace_hook(traces.append)
+        client.list_tables()
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0]['procedure'], 'list_tables')
+        stamps = [traces[0][stage] for stage in tracing.STAGES]
+        self.assertEqual(stamps, sorted(stamps))
+        client.cleanup()
+
+    def test_io_thread(self):
+        logging.info("testing io thread..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin', io_thread = True)
+        table_name = 'pundunpy_io_thread_table'
+        if table_name in client.list_tables():
+            self.assertTrue(client.delete_table(table_name))
+        self.assertTrue(client.create_table(table_name,
+                                            ['id'],
+                                            {'num_of_shards': 1}))
+        key = {'id': '0001'}
+        data = {'text': 'One'}
+        self.assertTrue(client.write(table_name, key, data))
+        def read():
+            return [client.read(table_name, key) for i in range(20)]
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            futures = [executor.submit(read) for i in range(8)]
+            for future in futures:
+                self.assertEqual(future.result(10), [data] * 20)
+        # Responses are dropped, the read is in flight on cleanup.
+        client.loop.call_soon_threadsafe(setattr, client.protocol,
+                                         'on_frame', lambda frame: None)
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            future = executor.submit(client.read, table_name, key)
+            while not client.message_dict:
+                time.sleep(0.001)
+            client.cleanup()
+            self.assertEqual(future.result(10),
+                             ('transport', 'connection_lost'))
+        self.assertFalse(client.io_thread.is_alive())
+        with self.assertRaises(RuntimeError):
+            client.read(table_name, key)
+        with self.assertRaises(RuntimeError):
+            client.read(table_name, key, do_async = True)
+
+    def test_parallel_executor(self):
+        logging.info("testing parallel executor..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin')
+        table_name = 'pundunpy_parallel_table'
+        if table_name in client.list_tables():
+            self.assertTrue(client.delete_table(table_name))
+        self.assertTrue(client.create_table(table_name,
+                                            ['id'],
+                                            {'num_of_shards': 1}))
+        client.cleanup()
+        keys = [{'id': str(i)} for i in range(100)]
+        data = [{'text': 'Row ' + str(i)} for i in range(100)]
+        with ParallelExecutor('127.0.0.1', 8887, 'admin', 'admin',
+                              processes = 2, chunk_size = 10) as executor:
+            writes = [(table_name, k, d) for (k, d) in zip(keys, data)]
+            self.assertEqual(executor.map('write', writes), [True] * 100)
+            reads = [(table_name, k) for k in keys]
+            self.assertEqual(executor.map('read', reads), data)
+
+    def test_loop_factory(self):
+        logging.info("testing loop factory..")
+        loops = []
+        def loop_factory():
+            loops.append(asyncio.new_event_loop())
+            return loops[-1]
+        client = Client('127.0.0.1', 8887, 'admin', 'admin',
+                         loop_factory = loop_factory)
+        self.assertEqual(loops, [client.loop])
+        self.assertIsInstance(client.list_tables(), list)
+        client.cleanup()
+
+    def test_pool_endpoints(self):
+        logging.info("testing pool endpoints..")
+        nodes = [('127.0.0.1', 8887), ('localhost', 8887)]
+        pool = ClientPool(nodes, None, 'admin', 'admin', size = 2)
+        self.assertEqual(len(pool.clients), 4)
+        for i in range(10):
+            self.assertIsInstance(pool.list_tables(), list)
+        health = pool.health()
+        self.assertEqual([(h['host'], h['port']) for h in health], nodes)
+        self.assertFalse(any(h['ejected'] for h in health))
+        pool.cleanup()
+
+    def test_pool_hedging(self):
+        logging.info("testing pool hedging..")
+        pool = ClientPool('127.0.0.1', 8887, 'admin', 'admin', size = 2,
+                          hedge_percentile = 50, hedge_window = 10)
+        table_name = 'pundunpy_hedging_table'
+        if table_name not in pool.list_tables():
+            self.assertTrue(pool.create_table(table_name,
+                                              ['id'],
+                                              {'num_of_shards': 1}))
+        key = {'id': '0001'}
+        data = {'text': 'One'}
+        self.assertTrue(pool.write(table_name, key, data))
+        for i in range(30):
+            self.assertEqual(pool.read(table_name, key), data)
+        self.assertIsNotNone(pool.hedge_delays['_read'].delay)
+        # The first send is slow, the hedge answers first.
+        hedge_delay = pool.hedge_delays['_read']
+        (hedge_delay.delay, hedge_delay.max_rate) = (0.01, 1)
+        primary = pool._pick()
+        send = primary._send
+        async def slow_send(cid, data, deadline, replay = False):
+            await asyncio.sleep(1)
+            await send(cid, data, deadline, replay)
+        primary._send = slow_send
+        hedges = hedge_delay.hedges
+        sent = primary.metrics.bytes_sent
+        start = time.monotonic()
+        self.assertEqual(pool.read(table_name, key), data)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(hedge_delay.hedges, hedges + 1)
+        pool.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(primary.metrics.bytes_sent, sent)
+        self.assertEqual(primary.message_dict, {})
+        self.assertEqual(len(primary.free_cids), 65536)
+        # No hedges beyond max_rate of the requests.
+        hedge_delay.max_rate = 0
+        self.assertEqual(pool.read(table_name, key), data)
+        self.assertEqual(hedge_delay.hedges, hedges + 1)
+        pool.cleanup()
+
+    def test_compile_schema(self):
+        logging.info("testing compile schema..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin')
+        table_name = 'pundunpy_schema_table'
+        if table_name in client.list_tables():
+            self.assertTrue(client.delete_table(table_name))
+        self.assertTrue(client.create_table(table_name,
+                                            ['id'],
+                                            {'num_of_shards': 1}))
+        client.compile_schema(table_name, {'id': str},
+                              {'text': str, 'count': int})
+        key = {'id': '0001'}
+        data = {'text': 'One', 'count': 1, 'tags': ['a', 'b']}
+        self.assertTrue(client.write(table_name, key, data))
+        self.assertEqual(client.read(table_name, key), data)
+        writes = [({'id': str(i)}, {'text': 'Row', 'count': i})
+                  for i in range(10)]
+        self.assertTrue(client.batch_write(table_name, writes))
+        self.assertEqual(client.read(table_name, {'id': '9'}),
+                         {'text': 'Row', 'count': 9})
+        client.cleanup()
+
+    def test_prepared(self):
+        logging.info("testing prepared operations..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin')
+        table_name = 'pundunpy_prepared_table'
+        if table_name in client.list_tables():
+            self.assertTrue(client.delete_table(table_name))
+        self.assertTrue(client.create_table(table_name,
+                                            ['id'],
+                                            {'num_of_shards': 1}))
+        write = client.prepare_write(table_name)
+        read = client.prepare_read(table_name)
+        for i in range(3):
+            self.assertTrue(write({'id': i}, {'count': i, 'text': 'Row'}))
+        self.assertEqual(read({'id': 2}), {'count': 2, 'text': 'Row'})
+        self.assertEqual(read({'id': 2}, timeout = 5),
+                         client.read(table_name, {'id': 2}))
+        client.cleanup()
+
+    def test_lazy_rows(self):
+        logging.info("testing lazy rows..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin', lazy_rows=True)
+        table_name = 'pundunpy_lazy_table'
+        if table_name in client.list_tables():
+            self.assertTrue(client.delete_table(table_name))
+        self.assertTrue(client.create_table(table_name,
+                                            ['id'],
+                                            {'num_of_shards': 1}))
+        data = {'text': 'One', 'count': 1, 'tags': ['a', 'b']}
+        self.assertTrue(client.write(table_name, {'id': 1}, data))
+        row = client.read(table_name, {'id': 1})
+        self.assertIsInstance(row, utils.FieldsView)
+        self.assertEqual(row['count'], 1)
+        self.assertEqual(row, data)
+        self.assertEqual(pickle.loads(pickle.dumps(row)), data)
+        client.cleanup()
+
+    def test_raw(self):
+        logging.info("testing raw responses..")
+        client = Client('127.0.0.1', 8887, 'admin', 'admin', raw='bytes')
+        table_name = 'pundunpy_raw_table'
+        client.create_table(table_name, ['id'], {'num_of_shards': 1})
+        data = {'text': 'One', 'count': 1}
+        raw = client.write(table_name, {'id': 1}, data)
+        self.assertIsInstance(raw, bytes)
+        raw = client.read(table_name, {'id': 1})
+        self.assertEqual(utils.format_rpdu(apollo.ApolloPdu.FromString(raw)),
+                         data)
+        self.assertEqual(client.read(table_name, {'id': 'missing'}),
+                         ('misc', '{error,not_found}'))
+        client.cleanup()
+        client = Client('127.0.0.1', 8887, 'admin', 'admin', raw='pdu')
+        rpdu = client.read(table_name, {'id': 1})
+        self.assertIsInstance(rpdu, apollo.ApolloPdu)
+        self.assertEqual(utils.format_rpdu(rpdu), data)
+        client.cleanup()
+
 if __name__ == '__main__':
     utils.setup_logging(level=logging.INFO)
     unittest.main()